@@ -4,12 +4,17 @@ from app import logger
 from util import entity_md5
 
 
+def add_volatile_fields(my_dict):
+    # only for the indexed document, these aren't part of the entity hash
+    my_dict['updated'] = my_dict.get('updated_date')
+    my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
+    return my_dict
+
+
 def create_bulk_actions(entity, index_name):
     bulk_actions = []
 
     my_dict = entity.to_dict()
-    my_dict['updated'] = my_dict.get('updated_date')
-    my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
     new_entity_hash = entity_md5(my_dict)
     old_entity_hash = entity.json_entity_hash
 
@@ -19,7 +24,7 @@ def create_bulk_actions(entity, index_name):
             "_op_type": "index",
             "_index": index_name,
             "_id": entity.id,
-            "_source": my_dict
+            "_source": add_volatile_fields(my_dict)
         }
         bulk_actions.append(index_record)
     else:
@@ -1,8 +1,13 @@
 import argparse
 import csv
 import datetime
+from collections import Counter
+from time import time
+
+from sqlalchemy import text
 
 from app import db, logger
+from util import elapsed
 
 
 """
@@ -10,6 +15,7 @@ from app import db, logger
   single institution: heroku run python -- -m merge.merge_institution --old_id=123 --merge_into_id=456
   or
   csv with header old_id, merge_into_id: heroku run python -- -m merge.merge_institution --input_file=merge_institutions.csv 
+  or, for a big csv, update each table once for all rows: add --bulk
 2. Notify Justin so he can update AND.
 3. You may need to run this again to update mid.affiliation, since AND may have assigned using old ids.
 """
@@ -33,11 +39,24 @@ def parse_arguments():
         type=int,
         default=None,
     )
+    parser.add_argument(
+        "-b",
+        "--bulk",
+        help="Merge all rows in the input file with one update per table",
+        action="store_true",
+    )
     return parser.parse_args()
 
 
-def merge_institutions(input_file, old_id, merge_into_id):
-    if input_file:
+def merge_institutions(input_file, old_id, merge_into_id, bulk=False):
+    if input_file and bulk:
+        with open(input_file, "r") as f:
+            merges = [
+                {"old_id": int(row["old_id"]), "merge_into_id": int(row["merge_into_id"])}
+                for row in csv.DictReader(f)
+            ]
+        process_institutions_bulk(merges)
+    elif input_file:
         with open(input_file, "r") as f:
             reader = csv.DictReader(f)
             count = 0
@@ -130,6 +149,118 @@ def process_institution(old_id, merge_into_id, null_ror_id=True):
     logger.info(f"Rows affected: {response.rowcount}")
 
 
+def replace_merged_ids_sql(column):
+    # rebuild the id array, swapping in merge_into_id for any merged id and keeping order
+    return f"""
+        CASE WHEN jsonb_typeof({column}) = 'array' AND jsonb_array_length({column}) > 0 THEN (
+            SELECT jsonb_agg(coalesce(to_jsonb(m.merge_into_id), e.element) ORDER BY e.idx)
+            FROM jsonb_array_elements({column}) WITH ORDINALITY e(element, idx)
+            LEFT JOIN institution_merge m ON m.old_id = (e.element #>> '{{}}')::bigint
+        ) ELSE {column} END
+    """
+
+
+def has_merged_id_sql(column):
+    return f"""
+        EXISTS (
+            SELECT 1
+            FROM jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof({column}) = 'array' THEN {column} ELSE '[]'::jsonb END
+            ) e(element)
+            JOIN institution_merge m ON m.old_id = e.element::bigint
+        )
+    """
+
+
+def collapse_merge_chains(connection, merge_count):
+    # A -> B and B -> C in one input both end at C, like they do when processed row by row
+    for _ in range(merge_count + 1):
+        response = connection.execute(text("""
+            UPDATE institution_merge m1
+            SET merge_into_id = m2.merge_into_id
+            FROM institution_merge m2
+            WHERE m1.merge_into_id = m2.old_id
+            AND m1.merge_into_id <> m2.merge_into_id
+        """))
+        if response.rowcount == 0:
+            break
+    else:
+        raise ValueError("merges in the input form a cycle")
+
+    if self_merges := connection.execute(
+        text("SELECT old_id FROM institution_merge WHERE old_id = merge_into_id")
+    ).fetchall():
+        raise ValueError(f"merges in the input form a cycle through {[row[0] for row in self_merges]}")
+
+
+def process_institutions_bulk(merges):
+    """
+    Merge many institutions at once. The old_id -> merge_into_id map goes in a temp table
+    and each table is updated in a single statement joined to it, all in one transaction.
+    """
+    old_id_counts = Counter(merge["old_id"] for merge in merges)
+    if duplicate_old_ids := sorted(old_id for old_id, count in old_id_counts.items() if count > 1):
+        raise ValueError(f"old_ids appear more than once in the input: {duplicate_old_ids}")
+
+    current_datetime = datetime.datetime.now()
+    logger.info(f"Merging {len(merges)} institutions in bulk")
+
+    statements = [
+        (
+            "mid.institution",
+            """
+                UPDATE mid.institution
+                SET merge_into_id = m.merge_into_id,
+                    merge_into_date = :now,
+                    updated_date = :now,
+                    ror_id = null
+                FROM institution_merge m
+                WHERE mid.institution.affiliation_id = m.old_id
+            """
+        ),
+        (
+            "mid.affiliation",
+            """
+                UPDATE mid.affiliation
+                SET affiliation_id = m.merge_into_id,
+                    updated_date = :now
+                FROM institution_merge m
+                WHERE mid.affiliation.affiliation_id = m.old_id
+            """
+        ),
+        (
+            "mid.affiliation_string_v2",
+            f"""
+                UPDATE mid.affiliation_string_v2
+                SET affiliation_ids = {replace_merged_ids_sql('affiliation_ids')},
+                    affiliation_ids_override = {replace_merged_ids_sql('affiliation_ids_override')}
+                WHERE {has_merged_id_sql('affiliation_ids')}
+                OR {has_merged_id_sql('affiliation_ids_override')}
+            """
+        ),
+    ]
+
+    with db.engine.begin() as connection:
+        connection.execute(text("""
+            CREATE TEMP TABLE institution_merge (
+                old_id bigint PRIMARY KEY,
+                merge_into_id bigint NOT NULL
+            ) ON COMMIT DROP
+        """))
+        connection.execute(
+            text("INSERT INTO institution_merge (old_id, merge_into_id) VALUES (:old_id, :merge_into_id)"),
+            merges
+        )
+        collapse_merge_chains(connection, len(merges))
+        connection.execute(text("ANALYZE institution_merge"))
+
+        for table, sql in statements:
+            start = time()
+            logger.info(f"Updating {table}")
+            response = connection.execute(text(sql), {"now": current_datetime})
+            logger.info(f"Rows affected: {response.rowcount} in {elapsed(start, 2)} seconds")
+
+
 if __name__ == "__main__":
     args = parse_arguments()
-    merge_institutions(args.input_file, args.old_id, args.merge_into_id)
+    merge_institutions(args.input_file, args.old_id, args.merge_into_id, args.bulk)
@@ -1,4 +1,4 @@
-from sqlalchemy import and_, or_, orm, func
+from sqlalchemy import and_, or_, orm, func, event, text
 from sqlalchemy.orm import foreign, remote, selectinload
 
 from app import db
@@ -58,7 +58,7 @@ from models.source_topic import SourceTopic
 from models.work_type import WorkType
 from models.work_related_version import WorkRelatedVersion
 from models.unpaywall import Unpaywall
-from models.work import Work
+from models.work import Work, on_records_change
 from models.work_keyword import WorkKeyword
 from models.work_concept import WorkConcept
 from models.work_topic import WorkTopic
@@ -70,6 +70,7 @@ from util import normalize
 
 REDIS_WORK_QUEUE = 'queue:work_store'
 REDIS_ADD_THINGS_QUEUE = 'queue:add_things'
+REDIS_ADD_THINGS_DEAD_LETTER_QUEUE = 'queue:add_things_dead'
 
 # relationships without association tables
 Work.mesh = db.relationship("Mesh", lazy='selectin', backref="work", cascade="all, delete-orphan")
@@ -81,6 +82,8 @@ Work.journal = db.relationship("Source", lazy='selectin', backref="work", uselis
 Work.extra_ids = db.relationship("WorkExtraIds", lazy='selectin', backref="work", cascade="all, delete-orphan")
 Work.related_works = db.relationship("WorkRelatedWork", lazy='selectin', backref="work", cascade="all, delete-orphan")
 Work.records = db.relationship("Record", lazy='selectin', backref="work")  # normally don't get, just for add_everything
+event.listen(Work.records, 'append', on_records_change)
+event.listen(Work.records, 'remove', on_records_change)
 WorkFunder.funder = db.relationship("Funder", lazy='selectin', uselist=False)
 Work.openapc = db.relationship("WorkOpenAPC", uselist=False)
 Work.embeddings = db.relationship("WorkEmbedding", uselist=False)
@@ -471,11 +474,14 @@ def openalex_id_from_pmid(pmid):
     paper_id = db.session.query(WorkExtraIds.paper_id).filter(WorkExtraIds.attribute_type==pmid_attribute_type, WorkExtraIds.attribute_value==pmid).limit(1).scalar()
     return f"W{paper_id}" if paper_id else None
 
-def hydrate_role(openalex_id_short):
+def hydrate_role(openalex_id_short, hydrated_roles=None):
     # for entities that are organizations that can have multiple roles
     # this takes a short ID of one of the roles (e.g., https://openalex.org/I32971472)
     # and adds some known info about the entity
+    # hydrated_roles can hold roles already loaded by prefetch_roles
     from models.institution import DELETED_INSTITUTION_ID
+    if hydrated_roles is not None and openalex_id_short in hydrated_roles:
+        return hydrated_roles[openalex_id_short]
     if openalex_id_short.startswith('I'):
         cls = Institution
         role = 'institution'
@@ -497,3 +503,53 @@ def hydrate_role(openalex_id_short):
         'id': entity.openalex_id,
         'works_count': works_count,
     }
+
+
+def prefetch_roles(entities):
+    """
+    Load the roles of a chunk of institutions, publishers or funders up front: all entity_link rows
+    in one query and the linked entities with counts in one query per class, instead of a query
+    per link. roles then reads prefetched_linked_ids and prefetched_roles.
+    """
+    from models.institution import DELETED_INSTITUTION_ID
+
+    short_ids = {e.openalex_id_short for e in entities}
+    if not short_ids:
+        return
+
+    rows = db.session.execute(
+        text("select id_1, id_2 from mid.entity_link where id_1 = any(:short_ids) or id_2 = any(:short_ids)"),
+        {"short_ids": list(short_ids)}
+    ).fetchall()
+    linked_ids = {short_id: {short_id} for short_id in short_ids}
+    for id_1, id_2 in rows:
+        for short_id in (id_1, id_2):
+            if short_id in linked_ids:
+                linked_ids[short_id].update((id_1, id_2))
+
+    ids_by_prefix = {}
+    for short_id in set().union(*linked_ids.values()):
+        ids_by_prefix.setdefault(short_id[0], []).append(int(short_id[1:]))
+
+    hydrated_roles = {f'I{DELETED_INSTITUTION_ID}': None}
+    for prefix, cls, id_column, role in [
+        ('I', Institution, Institution.affiliation_id, 'institution'),
+        ('P', Publisher, Publisher.publisher_id, 'publisher'),
+        ('F', Funder, Funder.funder_id, 'funder'),
+    ]:
+        if not ids_by_prefix.get(prefix):
+            continue
+        linked_entities = cls.query.options(
+            selectinload(cls.counts).raiseload('*'),
+            orm.Load(cls).raiseload('*')
+        ).filter(id_column.in_(ids_by_prefix[prefix])).all()
+        for linked_entity in linked_entities:
+            hydrated_roles[linked_entity.openalex_id_short] = {
+                'role': role,
+                'id': linked_entity.openalex_id,
+                'works_count': int(linked_entity.counts.paper_count or 0) if linked_entity.counts else 0,
+            }
+
+    for e in entities:
+        e.prefetched_linked_ids = linked_ids[e.openalex_id_short]
+        e.prefetched_roles = hydrated_roles
@@ -15,17 +15,35 @@ class Abstract(db.Model):
     abstract = db.Column(db.Text)
 
     @cached_property
-    def inverted_index(self):
+    def indexed_abstract_json(self):
+        # parse indexed_abstract once, everything below reads from this
         if not self.indexed_abstract:
             return None
-        loaded_json = json.loads(self.indexed_abstract)
-        return loaded_json.get("InvertedIndex", None)
+        return json.loads(self.indexed_abstract)
+
+    @cached_property
+    def inverted_index(self):
+        if not self.indexed_abstract_json:
+            return None
+        return self.indexed_abstract_json.get("InvertedIndex", None)
+
+    @cached_property
+    def words(self):
+        # distinct words in order of first appearance
+        return list(self.inverted_index.keys()) if self.inverted_index else []
+
+    @cached_property
+    def reconstructed_abstract(self):
+        if not self.inverted_index:
+            return None
+        positions = {}
+        for word, word_positions in self.inverted_index.items():
+            for position in word_positions:
+                positions[position] = word
+        return " ".join(positions[position] for position in sorted(positions))
 
     def to_dict(self, return_level="full"):
-        indexed_abstract_dict = json.loads(self.indexed_abstract)
-        return indexed_abstract_dict["InvertedIndex"]
+        return self.inverted_index
 
     def __repr__(self):
         return "<Abstract ( {} ) {}>".format(self.paper_id, self.indexed_abstract[0:100])
-
-
@@ -1,5 +1,4 @@
 import datetime
-import json
 import re
 
 from cached_property import cached_property
@@ -9,6 +8,7 @@ from app import MAX_MAG_ID
 from app import db
 from app import get_apiurl_from_openalex_url
 from app import logger
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 from util import truncate_on_word_break
 
@@ -130,8 +130,7 @@ class Author(db.Model):
             return None
         if not self.orcid_object.orcid_data:
             return None
-        my_data = json.loads(self.orcid_object.orcid_data.api_json)
-        return my_data.get("person", None)
+        return self.orcid_object.orcid_data.person
 
     def store(self):
         bulk_actions = []
@@ -174,8 +173,6 @@ class Author(db.Model):
                 logger.info(f"already merged into {self.merge_into_id}, not saving again")
         else:
             my_dict = self.to_dict()
-            my_dict['updated'] = my_dict.get('updated_date')
-            my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
             my_dict['@version'] = 1
             entity_hash = entity_md5(my_dict)
 
@@ -185,7 +182,7 @@ class Author(db.Model):
                     "_op_type": "index",
                     "_index": AUTHORS_INDEX,
                     "_id": self.openalex_id,
-                    "_source": my_dict
+                    "_source": add_volatile_fields(my_dict)
                 }
                 bulk_actions.append(index_record)
             else:
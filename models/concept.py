@@ -13,6 +13,7 @@ from app import USER_AGENT
 from app import db
 from app import get_apiurl_from_openalex_url
 from app import logger
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 
 
@@ -24,6 +25,78 @@ def as_concept_openalex_id(id):
     return f"{API_HOST}/C{id}"
 
 
+# entity_type -> query for (entity_id, paper_id) pairs, filtered to entity ids in :entity_ids
+ENTITY_PAPERS = {
+    "source": """
+        select work.journal_id as entity_id, work.paper_id
+        from mid.work work
+        where work.journal_id = any(:entity_ids)
+    """,
+    "institution": """
+        select affil.affiliation_id as entity_id, affil.paper_id
+        from mid.institution_papers_mv affil
+        where affil.affiliation_id = any(:entity_ids)
+    """,
+}
+
+_entity_concept_counts_ready = set()
+
+
+def entity_concept_counts_ready(entity_type):
+    # the first --full refresh of an entity type logs a row when it finishes, until then its rows are incomplete
+    if entity_type not in _entity_concept_counts_ready:
+        if db.session.execute(
+            text("select exists (select 1 from log.entity_concept_counts_refresh where entity_type = :entity_type)"),
+            {"entity_type": entity_type}
+        ).scalar():
+            _entity_concept_counts_ready.add(entity_type)
+    return entity_type in _entity_concept_counts_ready
+
+
+def entity_concepts(entity_type, entity_id, paper_count):
+    """
+    Concepts tagged on more than 20% of an entity's works, from the precomputed
+    mid.entity_concept_counts (see scripts/refresh_entity_concept_counts.py).
+    Counted from the entity's works until the entity type has had its first full refresh.
+    """
+    if not paper_count:
+        return []
+
+    if entity_concept_counts_ready(entity_type):
+        q = """
+            select ancestor_id as id, concept.wikidata_id as wikidata, concept.display_name,
+            concept.level::integer as level,
+            round(100 * (0.0+counts.paper_count)/:paper_count, 1)::float as score
+            from mid.entity_concept_counts counts
+            join mid.concept_api_mv concept on concept.field_of_study_id=counts.ancestor_id
+            where counts.entity_type=:entity_type and counts.entity_id=:entity_id
+            and counts.paper_count * 5 >= :paper_count
+            order by counts.paper_count desc
+            """
+    else:
+        q = f"""
+            select ancestors.ancestor_id as id, concept.wikidata_id as wikidata, concept.display_name,
+            concept.level::integer as level,
+            round(100 * (0.0+count(distinct wc.paper_id))/:paper_count, 1)::float as score
+            from ({ENTITY_PAPERS[entity_type]}) entity_papers
+            join mid.work_concept wc on wc.paper_id=entity_papers.paper_id
+            join mid.concept_self_and_ancestors_mv ancestors on ancestors.id=wc.field_of_study
+            join mid.concept_api_mv concept on concept.field_of_study_id=ancestors.ancestor_id
+            group by ancestors.ancestor_id, concept.wikidata_id, concept.display_name, concept.level
+            order by score desc
+            """
+    rows = db.session.execute(
+        text(q), {
+            "entity_type": entity_type, "entity_id": entity_id,
+            "entity_ids": [entity_id], "paper_count": paper_count
+        }
+    ).fetchall()
+    response = [dict(row) for row in rows if row["score"] and row["score"] > 20]
+    for row in response:
+        row["id"] = as_concept_openalex_id(row["id"])
+    return response
+
+
 class Concept(db.Model):
     __table_args__ = {'schema': 'mid'}
     __tablename__ = "concept_api_mv"
@@ -269,23 +342,13 @@ class Concept(db.Model):
 
     @cached_property
     def wikidata_data(self):
-        if not self.wikidata_id:
+        # filled in the background by scripts.prefetch_wiki_data, never fetched live during store
+        if not self.wikidata_id or not self.wikidata_json:
             return None
         try:
-            data = json.loads(self.wikidata_json)
-        except:
-            data = None
-        if not data:
-            url = f"https://www.wikidata.org/wiki/Special:EntityData/{self.wikidata_id_short}.json"
-            logger.info(f"calling wikidata live with {url} for {self.openalex_id}")
-            r = requests.get(url, headers={"User-Agent": USER_AGENT})
-            data = r.json()
-            # are claims too big?
-            try:
-                del data["entities"][self.wikidata_id_short]["claims"]
-            except:
-                pass
-        return data
+            return json.loads(self.wikidata_json)
+        except ValueError:
+            return None
 
 
     @cached_property
@@ -365,8 +428,6 @@ class Concept(db.Model):
         bulk_actions = []
 
         my_dict = self.to_dict()
-        my_dict['updated'] = my_dict.get('updated_date')
-        my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
         my_dict['@version'] = 1
         entity_hash = entity_md5(my_dict)
         old_entity_hash = self.json_entity_hash and self.json_entity_hash.json_entity_hash
@@ -377,7 +438,7 @@ class Concept(db.Model):
                 "_op_type": "index",
                 "_index": CONCEPTS_INDEX,
                 "_id": self.openalex_id,
-                "_source": my_dict
+                "_source": add_volatile_fields(my_dict)
             }
             bulk_actions.append(index_record)
         else:
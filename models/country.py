@@ -37,6 +37,12 @@ class Country(db.Model):
     def iso_id(self):
         return f"https://www.iso.org/obp/ui/#iso:code:3166:{self.id}"
 
+    elastic_count_key = "authorships.countries"
+
+    @property
+    def elastic_count_id(self):
+        return self.id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, COUNTRIES_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -62,7 +68,7 @@ class Country(db.Model):
                 "continent": self.continent.to_dict(),
                 "is_global_south": self.is_global_south,
                 "works_count": works_count_from_api("authorships.countries", self.openalex_id),
-                "cited_by_count": citation_count_from_elastic("authorships.countries", self.id),
+                "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                 "authors_api_url": f"https://api.openalex.org/authors?filter=last_known_institutions.country_code:{self.id}",
                 "institutions_api_url": f"https://api.openalex.org/institutions?filter=country_code:{self.id}",
                 "works_api_url": f"https://api.openalex.org/works?filter=authorships.countries:{self.id}",
@@ -8,6 +8,7 @@ from app import COUNTRIES_ENDPOINT_PREFIX
 from app import FUNDERS_INDEX
 from app import db
 from app import logger
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 
 
@@ -82,18 +83,21 @@ class Funder(db.Model):
 
     @cached_property
     def roles(self):
-        q = """
-        select id_1, id_2
-        from mid.entity_link
-        where id_1 = :short_id
-        or id_2 = :short_id
-        """
-        rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
-        entity_ids = set()
-        entity_ids.add(self.openalex_id_short)
-        for row in rows:
-            entity_ids.add(row[0])
-            entity_ids.add(row[1])
+        if hasattr(self, "prefetched_linked_ids"):
+            entity_ids = set(self.prefetched_linked_ids)
+        else:
+            q = """
+            select id_1, id_2
+            from mid.entity_link
+            where id_1 = :short_id
+            or id_2 = :short_id
+            """
+            rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
+            entity_ids = set()
+            entity_ids.add(self.openalex_id_short)
+            for row in rows:
+                entity_ids.add(row[0])
+                entity_ids.add(row[1])
         response = []
         for entity_id in entity_ids:
             if entity_id == self.openalex_id_short:
@@ -109,9 +113,9 @@ class Funder(db.Model):
                 # there may be a better long-term solution for this
                 if entity_id.startswith('F'):
                     continue
-                e = hydrate_role(entity_id)
+                e = hydrate_role(entity_id, getattr(self, "prefetched_roles", None))
                 if e is not None:
-                    response.append(hydrate_role(entity_id))
+                    response.append(e)
         return response
 
     def oa_percent(self):
@@ -232,8 +236,6 @@ class Funder(db.Model):
                 logger.info(f"already merged into {self.merge_into_id}, not saving again")
         else:
             my_dict = self.to_dict()
-            my_dict['updated'] = my_dict.get('updated_date')
-            my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
             my_dict['@version'] = 1
             entity_hash = entity_md5(my_dict)
 
@@ -243,7 +245,7 @@ class Funder(db.Model):
                     "_op_type": "index",
                     "_index": FUNDERS_INDEX,
                     "_id": self.openalex_id,
-                    "_source": my_dict
+                    "_source": add_volatile_fields(my_dict)
                 }
                 bulk_actions.append(index_record)
             else:
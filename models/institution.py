@@ -2,6 +2,7 @@ import datetime
 import json
 import os
 import urllib.parse
+from collections import defaultdict
 from time import sleep
 
 import requests
@@ -15,11 +16,11 @@ from sqlalchemy.orm import selectinload
 from app import COUNTRIES_ENDPOINT_PREFIX
 from app import INSTITUTIONS_INDEX
 from app import MAX_MAG_ID
-from app import USER_AGENT
 from app import db
 from app import get_apiurl_from_openalex_url
 from app import logger
 from const import SUPER_SYSTEM_INSTITUTIONS
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 
 DELETED_INSTITUTION_ID = 4389424196
@@ -174,20 +175,83 @@ class Institution(db.Model):
             response = [obj.to_dict("minimum") for obj in objs]
         return response
 
+    @staticmethod
+    def prefetch_ror_data(institutions):
+        """
+        Fill acronyms, aliases, external_ids, labels and relationship_dicts for a chunk of
+        institutions with one query per ins.ror_* table, instead of five queries per institution.
+        """
+        ror_ids = list({i.ror_id for i in institutions if i.ror_id})
+
+        def rows_by_ror_id(q):
+            grouped = defaultdict(list)
+            if ror_ids:
+                for row in db.session.execute(text(q), {"ror_ids": ror_ids}).fetchall():
+                    grouped[row["ror_id"]].append(row)
+            return grouped
+
+        acronyms = rows_by_ror_id("select ror_id, acronym from ins.ror_acronyms where ror_id = any(:ror_ids)")
+        aliases = rows_by_ror_id("select ror_id, alias from ins.ror_aliases where ror_id = any(:ror_ids)")
+        external_ids = rows_by_ror_id(
+            "select ror_id, external_id_type, external_id from ins.ror_external_ids where ror_id = any(:ror_ids)"
+        )
+        labels = rows_by_ror_id("select * from ins.ror_labels where ror_id = any(:ror_ids)")
+        relationships = rows_by_ror_id("""
+            select ror_relationships.ror_id, relationship_type, ror_grid_equivalents.ror_id as related_ror_id
+            from ins.ror_relationships
+            join ins.ror_grid_equivalents on ror_grid_equivalents.grid_id = ror_relationships.related_grid_id
+            where ror_relationships.ror_id = any(:ror_ids)
+        """)
+
+        related_ror_ids = {row["related_ror_id"] for rows in relationships.values() for row in rows}
+        related_by_ror_id = defaultdict(list)
+        if related_ror_ids:
+            related_objs = db.session.query(Institution).options(
+                selectinload(Institution.ror).raiseload('*'),
+                selectinload(Institution.ancestors).raiseload('*'),
+                orm.Load(Institution).raiseload('*')
+            ).filter(Institution.ror_id.in_(related_ror_ids)).all()
+            for obj in related_objs:
+                related_by_ror_id[obj.ror_id].append(obj)
+
+        for institution in institutions:
+            institution.__dict__["acronyms"] = [row["acronym"] for row in acronyms[institution.ror_id]]
+            institution.__dict__["aliases"] = [row["alias"] for row in aliases[institution.ror_id]]
+            institution.__dict__["external_ids"] = [
+                {"type": row["external_id_type"], "id": row["external_id"]} for row in external_ids[institution.ror_id]
+            ]
+            institution.__dict__["labels"] = [dict(row) for row in labels[institution.ror_id]]
+
+            relationship_dict = {}
+            for row in relationships[institution.ror_id]:
+                relationship_dict[row["related_ror_id"]] = row["relationship_type"].lower()
+            # related institutions can be shared by the chunk, so serialize each one right after setting its status
+            related_dicts = []
+            for related_ror_id, relationship_status in relationship_dict.items():
+                for obj in related_by_ror_id[related_ror_id]:
+                    obj.relationship_status = relationship_status
+                    related_dicts.append(obj.to_dict("minimum"))
+            institution.__dict__["relationship_dicts"] = sorted(
+                related_dicts, key=lambda x: (x.get("relationship") or "", x.get("display_name") or "")
+            )
+
     @cached_property
     def roles(self):
-        q = """
-        select id_1, id_2
-        from mid.entity_link
-        where id_1 = :short_id
-        or id_2 = :short_id
-        """
-        rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
-        entity_ids = set()
-        entity_ids.add(self.openalex_id_short)
-        for row in rows:
-            entity_ids.add(row[0])
-            entity_ids.add(row[1])
+        if hasattr(self, "prefetched_linked_ids"):
+            entity_ids = set(self.prefetched_linked_ids)
+        else:
+            q = """
+            select id_1, id_2
+            from mid.entity_link
+            where id_1 = :short_id
+            or id_2 = :short_id
+            """
+            rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
+            entity_ids = set()
+            entity_ids.add(self.openalex_id_short)
+            for row in rows:
+                entity_ids.add(row[0])
+                entity_ids.add(row[1])
         response = []
         for entity_id in entity_ids:
             if entity_id == self.openalex_id_short:
@@ -198,9 +262,9 @@ class Institution(db.Model):
                 })
             else:
                 from models import hydrate_role
-                e = hydrate_role(entity_id)
+                e = hydrate_role(entity_id, getattr(self, "prefetched_roles", None))
                 if e is not None:
-                    response.append(hydrate_role(entity_id))
+                    response.append(e)
 
         # there can be duplicate funders
         # quick fix for now: only keep the funder with the highest works_count
@@ -248,21 +312,13 @@ class Institution(db.Model):
 
     @cached_property
     def wikipedia_data(self):
-        if not self.wiki_page:
+        # filled in the background by scripts.prefetch_wiki_data, never fetched live during store
+        if not self.wiki_page or not self.wikipedia_json:
             return None
         try:
-            data = json.loads(self.wikipedia_json)
-        except:
-            data = None
-
-        if not data:
-            wikipedia_page_name = self.wiki_page.rsplit("/", 1)[-1]
-            url = f"https://en.wikipedia.org/w/api.php?action=query&format=json&formatversion=2&prop=pageprops%7Cpageimages%7Cpageterms&piprop=original%7Cthumbnail&pilicense=any&titles={wikipedia_page_name}&pithumbsize=100&redirects="
-            logger.info(f"calling wikipedia live for {self.openalex_id} with {url}")
-            r = requests.get(url, headers={"User-Agent": USER_AGENT})
-            # print(r.json())
-            data = r.json()
-        return data
+            return json.loads(self.wikipedia_json)
+        except ValueError:
+            return None
 
     # is whatever the wikipedia url redirects to
     @cached_property
@@ -292,24 +348,13 @@ class Institution(db.Model):
 
     @cached_property
     def wikidata_data(self):
-        if not self.wikidata_id:
+        # filled in the background by scripts.prefetch_wiki_data, never fetched live during store
+        if not self.wikidata_id or not self.wikidata_json:
             return None
         try:
-            data = json.loads(self.wikidata_json)
-        except:
-            data = None
-        if not data:
-            url = f"https://www.wikidata.org/wiki/Special:EntityData/{self.wikidata_id_short}.json"
-            logger.info(f"calling wikidata live with {url} for {self.openalex_id}")
-            r = requests.get(url, headers={"User-Agent": USER_AGENT})
-            try:
-                data = r.json()
-                # are claims too big?
-                del data["entities"][self.wikidata_id_short]["claims"]
-            except:
-                pass
-            # print(response)
-        return data
+            return json.loads(self.wikidata_json)
+        except ValueError:
+            return None
 
     @property
     def is_super_system(self):
@@ -342,8 +387,6 @@ class Institution(db.Model):
                 logger.info(f"already merged into {self.merge_into_id}, not saving again")
         else:
             my_dict = self.to_dict()
-            my_dict['updated'] = my_dict.get('updated_date')
-            my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
             my_dict['@version'] = 1
             entity_hash = entity_md5(my_dict)
             if entity_hash != self.json_entity_hash:
@@ -352,7 +395,7 @@ class Institution(db.Model):
                     "_op_type": "index",
                     "_index": INSTITUTIONS_INDEX,
                     "_id": self.openalex_id,
-                    "_source": my_dict
+                    "_source": add_volatile_fields(my_dict)
                 }
                 bulk_actions.append(index_record)
             else:
@@ -363,28 +406,12 @@ class Institution(db.Model):
 
     @cached_property
     def concepts(self):
-        from models.concept import as_concept_openalex_id
+        from models.concept import entity_concepts
 
         if not self.counts or not self.counts.paper_count:
             return []
 
-        q = """
-            select ancestor_id as id, concept.wikidata_id as wikidata, ancestor_name as display_name, ancestor_level as level, round(100 * (0.0+count(distinct affil.paper_id))/counts.paper_count, 1)::float as score
-            from mid.institution institution 
-            join mid.citation_institutions_mv counts on counts.affiliation_id=institution.affiliation_id
-            join mid.institution_papers_mv affil on affil.affiliation_id=institution.affiliation_id
-            join mid.work_concept wc on wc.paper_id=affil.paper_id
-            join mid.concept_self_and_ancestors_mv ancestors on ancestors.id=wc.field_of_study
-            join mid.concept_api_mv concept on concept.field_of_study_id=ancestor_id                        
-            where affil.affiliation_id=:institution_id
-            group by ancestor_id, concept.wikidata_id, ancestor_name, ancestor_level, counts.paper_count
-            order by score desc
-            """
-        rows = db.session.execute(text(q), {"institution_id": self.institution_id}).fetchall()
-        response = [dict(row) for row in rows if row["score"] and row["score"] > 20]
-        for row in response:
-            row["id"] = as_concept_openalex_id(row["id"])
-        return response
+        return entity_concepts("institution", self.institution_id, self.counts.paper_count)
     
     @cached_property
     def topics(self):
@@ -27,6 +27,12 @@ class InstitutionType(db.Model):
     def openalex_id(self):
         return f"https://openalex.org/institution-types/{self.id}"
 
+    elastic_count_key = "authorships.institutions.type"
+
+    @property
+    def elastic_count_id(self):
+        return self.id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, INSTITUTION_TYPES_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -41,7 +47,7 @@ class InstitutionType(db.Model):
             response.update({
                 "description": self.description if self.description else None,
                 "works_count": works_count_from_api("authorships.institutions.type", self.id),
-                "cited_by_count": citation_count_from_elastic("authorships.institutions.type", self.id),
+                "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                 "works_api_url": f"https://api.openalex.org/works?filter=authorships.institutions.type:{self.id}",
                 "updated_date": datetime.datetime.utcnow().isoformat(),
                 "created_date": self.created_date.isoformat()[0:10] if isinstance(self.created_date, datetime.datetime) else self.created_date[0:10]
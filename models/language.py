@@ -26,6 +26,12 @@ class Language(db.Model):
     def openalex_id(self):
         return f"https://openalex.org/languages/{self.id}"
 
+    elastic_count_key = "language"
+
+    @property
+    def elastic_count_id(self):
+        return self.id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, LANGUAGES_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -39,7 +45,7 @@ class Language(db.Model):
         if return_level == "full":
             response.update({
                 "works_count": works_count_from_api("language", self.openalex_id),
-                "cited_by_count": citation_count_from_elastic("language", self.id),
+                "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                 "works_api_url": f"https://api.openalex.org/works?filter=language:{self.id}",
                 "updated_date": datetime.datetime.utcnow().isoformat(),
                 "created_date": self.created_date.isoformat()[0:10] if isinstance(self.created_date, datetime.datetime) else self.created_date[0:10]
@@ -45,6 +45,12 @@ class License(db.Model):
     def openalex_api_url(self):
         return get_apiurl_from_openalex_url(self.openalex_id)
 
+    elastic_count_key = "locations.license_id.keyword"
+
+    @property
+    def elastic_count_id(self):
+        return self.openalex_id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, LICENSES_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -60,12 +66,8 @@ class License(db.Model):
                 {
                     "url": self.url,
                     "description": self.description,
-                    "works_count": works_count_from_elastic(
-                        "locations.license_id.keyword", self.openalex_id
-                    ),
-                    "cited_by_count": citation_count_from_elastic(
-                        "locations.license_id.keyword", self.openalex_id
-                    ),
+                    "works_count": works_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
+                    "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                     "works_api_url": f"https://api.openalex.org/works?filter=locations.license_id:{self.openalex_id_short}",
                     "updated_date": datetime.datetime.utcnow().isoformat(),
                     "created_date": self.created_date.isoformat()[0:10]
@@ -1,13 +1,36 @@
+import json
+
+from sqlalchemy.orm import deferred
+
 from app import db
 
 
+# person_json is the "person" section of api_json, which is all Author.store needs.
+# it's filled from api_json by Author.orcid_data_person if missing, or for everything at once:
+# alter table mid.orcid add column person_json text;
+# update mid.orcid set person_json = (api_json::jsonb -> 'person')::text where person_json is null;
+# and kept up to date on ingest with:
+# create or replace function mid.orcid_set_person_json() returns trigger as $$
+# begin new.person_json := (new.api_json::jsonb -> 'person')::text; return new; end $$ language plpgsql;
+# create trigger orcid_set_person_json before insert or update of api_json on mid.orcid
+# for each row execute function mid.orcid_set_person_json();
+
 class Orcid(db.Model):
     __table_args__ = {'schema': 'mid'}
     __tablename__ = "orcid"
 
     orcid = db.Column(db.Text, db.ForeignKey("mid.author_orcid.orcid"), primary_key=True)
-    api_json = db.Column(db.Text)
+    # full record with works lists, can be hundreds of KB, only loaded when accessed
+    api_json = deferred(db.Column(db.Text))
+    person_json = db.Column(db.Text)
 
+    @property
+    def person(self):
+        if self.person_json is None:
+            if not self.api_json:
+                return None
+            self.person_json = json.dumps(json.loads(self.api_json).get("person", None))
+        return json.loads(self.person_json)
 
     def __repr__(self):
         return "<Orcid ( {} )>".format(self.orcid)
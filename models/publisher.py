@@ -7,6 +7,7 @@ from sqlalchemy.dialects.postgresql import JSONB
 from app import PUBLISHERS_INDEX
 from app import db
 from app import logger
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 
 
@@ -72,18 +73,21 @@ class Publisher(db.Model):
 
     @cached_property
     def roles(self):
-        q = """
-        select id_1, id_2
-        from mid.entity_link
-        where id_1 = :short_id
-        or id_2 = :short_id
-        """
-        rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
-        entity_ids = set()
-        entity_ids.add(self.openalex_id_short)
-        for row in rows:
-            entity_ids.add(row[0])
-            entity_ids.add(row[1])
+        if hasattr(self, "prefetched_linked_ids"):
+            entity_ids = set(self.prefetched_linked_ids)
+        else:
+            q = """
+            select id_1, id_2
+            from mid.entity_link
+            where id_1 = :short_id
+            or id_2 = :short_id
+            """
+            rows = db.session.execute(text(q), {"short_id": self.openalex_id_short}).fetchall()
+            entity_ids = set()
+            entity_ids.add(self.openalex_id_short)
+            for row in rows:
+                entity_ids.add(row[0])
+                entity_ids.add(row[1])
         response = []
         for entity_id in entity_ids:
             if entity_id == self.openalex_id_short:
@@ -94,9 +98,9 @@ class Publisher(db.Model):
                 })
             else:
                 from models import hydrate_role
-                e = hydrate_role(entity_id)
+                e = hydrate_role(entity_id, getattr(self, "prefetched_roles", None))
                 if e is not None:
-                    response.append(hydrate_role(entity_id))
+                    response.append(e)
 
         # there can be duplicate funders
         # quick fix for now: only keep the funder with the highest works_count
@@ -217,8 +221,6 @@ class Publisher(db.Model):
                 logger.info(f"already merged into {self.merge_into_id}, not saving again")
         else:
             my_dict = self.to_dict()
-            my_dict['updated'] = my_dict.get('updated_date')
-            my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
             my_dict['@version'] = 1
             entity_hash = entity_md5(my_dict)
 
@@ -228,7 +230,7 @@ class Publisher(db.Model):
                     "_op_type": "index",
                     "_index": PUBLISHERS_INDEX,
                     "_id": self.openalex_id,
-                    "_source": my_dict
+                    "_source": add_volatile_fields(my_dict)
                 }
                 bulk_actions.append(index_record)
             else:
@@ -1,5 +1,6 @@
 import datetime
 import json
+from collections import defaultdict
 
 from cached_property import cached_property
 from sqlalchemy import orm, and_, desc
@@ -13,6 +14,8 @@ from models.location import normalize_license
 from models.merge_utils import merge_primary_with_parsed
 from util import normalize_title_like_sql
 
+TITLE_MATCH_LIMIT = 50
+
 
 class Record(db.Model):
     __table_args__ = {'schema': 'ins'}
@@ -281,21 +284,24 @@ class Record(db.Model):
 
         # by title
         if not matching_work:
-            # don't use self.work_matches_by_title because sometimes there are many matches and
-            # setting lazy='dynamic' to enable a limit here causes all properties of works to be loaded
-            work_matches_by_title = db.session.query(Work).options(
-                orm.Load(Work).joinedload(Work.affiliations).raiseload('*'),
-                orm.Load(Work).raiseload('*')
-            ).filter(
-                and_(
-                    Work.original_title.not_in(BAD_TITLES),
-                    self.normalized_title is not None,
-                    len(self.normalized_title) > 19,
-                    Work.unpaywall_normalize_title == self.normalized_title
-                )
-            ).order_by(
-                desc(Work.full_updated_date)
-            ).limit(50).all()
+            if hasattr(self, 'prefetched_work_matches_by_title'):
+                work_matches_by_title = self.prefetched_work_matches_by_title
+            else:
+                # don't use self.work_matches_by_title because sometimes there are many matches and
+                # setting lazy='dynamic' to enable a limit here causes all properties of works to be loaded
+                work_matches_by_title = db.session.query(Work).options(
+                    orm.Load(Work).joinedload(Work.affiliations).raiseload('*'),
+                    orm.Load(Work).raiseload('*')
+                ).filter(
+                    and_(
+                        Work.original_title.not_in(BAD_TITLES),
+                        self.normalized_title is not None,
+                        len(self.normalized_title) > 19,
+                        Work.unpaywall_normalize_title == self.normalized_title
+                    )
+                ).order_by(
+                    desc(Work.full_updated_date)
+                ).limit(TITLE_MATCH_LIMIT).all()
 
             if matching_works := [w for w in work_matches_by_title if
                                   not w.merge_into_id]:
@@ -348,6 +354,61 @@ class Record(db.Model):
             self.mint_work()
         return
 
+    @property
+    def needs_title_match(self):
+        # a title match is only tried when doi, pmid and arxiv_id don't find an unmerged work
+        if not self.is_primary_record() or self.record_type == "override" or self.genre == "component":
+            return False
+        if not self.normalized_title or len(self.normalized_title) <= 19:
+            return False
+        return not any(
+            not w.merge_into_id for w in
+            self.work_matches_by_doi + self.work_matches_by_pmid + self.work_matches_by_arxiv_id
+        )
+
+    @staticmethod
+    def prefetch_work_matches_by_title(records):
+        """
+        Load title match candidates for a chunk of records in one query, so get_or_mint_work
+        doesn't query per record. Only use for records that don't share a title with other
+        records in the chunk, because works minted during the chunk won't be in the candidates.
+        """
+        from models.work import Work
+
+        records = [r for r in records if r.needs_title_match]
+        titles = list({r.normalized_title for r in records})
+        if not titles:
+            return
+
+        ranked_works = db.session.query(
+            Work.paper_id,
+            func.row_number().over(
+                partition_by=Work.unpaywall_normalize_title,
+                order_by=desc(Work.full_updated_date)
+            ).label('title_rank')
+        ).filter(
+            Work.original_title.not_in(BAD_TITLES),
+            Work.unpaywall_normalize_title.in_(titles)
+        ).subquery()
+
+        works = db.session.query(Work).options(
+            orm.Load(Work).joinedload(Work.affiliations).raiseload('*'),
+            orm.Load(Work).raiseload('*')
+        ).join(
+            ranked_works, Work.paper_id == ranked_works.c.paper_id
+        ).filter(
+            ranked_works.c.title_rank <= TITLE_MATCH_LIMIT
+        ).order_by(
+            desc(Work.full_updated_date)
+        ).all()
+
+        works_by_title = defaultdict(list)
+        for work in works:
+            works_by_title[work.unpaywall_normalize_title].append(work)
+
+        for record in records:
+            record.prefetched_work_matches_by_title = works_by_title[record.normalized_title]
+
     def is_primary_record(self):
         return self.record_type and self.record_type in {
             "crossref_doi",
@@ -33,6 +33,12 @@ class SDG(db.Model):
     def un_metadata_id(self):
         return f"https://metadata.un.org/sdg/{self.sdg_id}"
 
+    elastic_count_key = "sustainable_development_goals.id"
+
+    @property
+    def elastic_count_id(self):
+        return self.un_metadata_id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, SDGS_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -52,7 +58,7 @@ class SDG(db.Model):
                 },
                 "description": self.description if self.description else "",
                 "works_count": works_count_from_api("sustainable_development_goals.id", self.openalex_id),
-                "cited_by_count": citation_count_from_elastic("sustainable_development_goals.id", self.un_metadata_id),
+                "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                 "works_api_url": f"https://api.openalex.org/works?filter=sustainable_development_goals.id:{self.un_metadata_id}",
                 "image_url": self.image_url,
                 "image_thumbnail_url": self.image_thumbnail_url,
@@ -2,7 +2,6 @@ import datetime
 import json
 
 from cached_property import cached_property
-from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.types import ARRAY
 
@@ -11,6 +10,7 @@ from app import MAX_MAG_ID
 from app import db
 from app import get_apiurl_from_openalex_url
 from app import logger
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 from util import truncate_on_word_break
 
@@ -112,8 +112,6 @@ class Source(db.Model):
                 logger.info(f"already merged into {self.merge_into_id}, not saving again")
         else:
             my_dict = self.to_dict()
-            my_dict['updated'] = my_dict.get('updated_date')
-            my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
             my_dict['@version'] = 1
             entity_hash = entity_md5(my_dict)
 
@@ -123,7 +121,7 @@ class Source(db.Model):
                     "_op_type": "index",
                     "_index": "sources-v2",
                     "_id": self.openalex_id,
-                    "_source": my_dict
+                    "_source": add_volatile_fields(my_dict)
                 }
                 bulk_actions.append(index_record)
             else:
@@ -157,28 +155,10 @@ class Source(db.Model):
 
     @cached_property
     def concepts(self):
-        from models.concept import as_concept_openalex_id
-        response = []
-        if self.counts and self.counts.paper_count:
-            q = """
-                select ancestor_id as id, concept.wikidata_id as wikidata, ancestor_name as display_name,
-                ancestor_level as level,
-                round(100 * (0.0+count(distinct wc.paper_id))/counts.paper_count, 1)::float as score
-                from mid.journal journal
-                join mid.citation_journals_mv counts on counts.journal_id=journal.journal_id
-                join mid.work work on work.journal_id=journal.journal_id
-                join mid.work_concept wc on wc.paper_id=work.paper_id
-                join mid.concept_self_and_ancestors_mv ancestors on ancestors.id=wc.field_of_study
-                join mid.concept_api_mv concept on concept.field_of_study_id=ancestor_id
-                where journal.journal_id=:journal_id
-                group by ancestor_id, concept.wikidata_id, ancestor_name, ancestor_level, counts.paper_count
-                order by score desc
-                """
-            rows = db.session.execute(text(q), {"journal_id": self.journal_id}).fetchall()
-            response = [dict(row) for row in rows if row["score"] and row["score"] > 20]
-            for row in response:
-                row["id"] = as_concept_openalex_id(row["id"])
-        return response
+        from models.concept import entity_concepts
+        if not self.counts:
+            return []
+        return entity_concepts("source", self.journal_id, self.counts.paper_count)
     
     @cached_property
     def topics(self):
@@ -8,6 +8,7 @@ from app import get_apiurl_from_openalex_url
 from app import logger
 from app import TOPICS_INDEX
 import models
+from bulk_actions import add_volatile_fields
 from util import entity_md5
 
 
@@ -68,8 +69,6 @@ class Topic(db.Model):
         bulk_actions = []
 
         my_dict = self.to_dict()
-        my_dict['updated'] = my_dict.get('updated_date')
-        my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
         my_dict['@version'] = 1
         entity_hash = entity_md5(my_dict)
         old_entity_hash = self.json_entity_hash
@@ -80,7 +79,7 @@ class Topic(db.Model):
                 "_op_type": "index",
                 "_index": TOPICS_INDEX,
                 "_id": self.openalex_id,
-                "_source": my_dict
+                "_source": add_volatile_fields(my_dict)
             }
             bulk_actions.append(index_record)
         else:
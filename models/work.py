@@ -4,8 +4,9 @@ import json
 import os
 import re
 from collections import defaultdict
+from contextlib import contextmanager
 from enum import IntEnum
-from functools import cache
+from functools import cache, lru_cache, wraps
 from time import sleep
 from time import time
 from typing import List
@@ -35,13 +36,14 @@ from models.topic import is_valid_topic_id
 from models.keyword import is_valid_keyword_id
 from models.work_sdg import get_and_save_sdgs
 from models.institution import as_institution_openalex_id
+from bulk_actions import add_volatile_fields
 from util import clean_doi, entity_md5, normalize_title_like_sql, \
     matching_author_strings, get_crossref_json_from_unpaywall, \
     words_within_distance
 from util import clean_html
 from util import detect_language_from_abstract_and_title
 from util import elapsed
-from util import f_generate_inverted_index
+from util import generate_inverted_index
 from util import normalize_orcid
 from util import normalize_simple
 from util import struct_changed
@@ -50,6 +52,8 @@ from util import work_has_null_author_ids
 from timeit import default_timer as timer
 
 DELETED_WORK_ID = 4285719527
+MAX_AUTHORSHIPS_INDEXED = 100
+MAX_INDEXED_ABSTRACT_LENGTH = 60000
 
 
 def elastic_index_suffix(publication_year):
@@ -180,6 +184,33 @@ def override_location_sources(locations):
     return locations
 
 
+def with_records_cache(method):
+    # memoize the Work.records views for the duration of one call
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.records_cache():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@lru_cache(maxsize=1024)
+def record_author_match_names(record_author_json):
+    # frozenset of author match strings for a record's authors json
+    author_match_names = set()
+    for author_dict in json.loads(record_author_json):
+        original_name = author_dict["raw"]
+        if author_dict["family"]:
+            original_name = "{} {}".format(author_dict["given"],
+                                           author_dict["family"])
+
+        raw_author_string = original_name if original_name else None
+        author_match_strings = models.Author.matching_author_strings(
+            raw_author_string)
+        if author_match_strings:
+            author_match_names.update(author_match_strings)
+    return frozenset(author_match_names)
+
+
 class OAStatusEnum(IntEnum):
     # we prioritize publisher-hosted versions
     # see https://docs.openalex.org/api-entities/works/work-object#any_repository_has_fulltext
@@ -320,19 +351,18 @@ class Work(db.Model):
 
         self.affiliations = []
 
-        author_sequence_nos = sorted(
-            set([a.author_sequence_number for a in all_affiliations]))
+        # all_affiliations is sorted, so each group is in affiliation_sequence_number order
+        affiliations_by_sequence = defaultdict(list)
+        for a in all_affiliations:
+            affiliations_by_sequence[a.author_sequence_number].append(a)
+        author_sequence_nos = sorted(affiliations_by_sequence.keys())
 
         update_original_affiliations = False
         if len(record_author_dict_list) == len(author_sequence_nos):
             update_original_affiliations = True
 
         for author_idx, author_sequence_no in enumerate(author_sequence_nos):
-            author_affiliations = sorted(
-                [a for a in all_affiliations if
-                 a.author_sequence_number == author_sequence_no],
-                key=lambda a: a.affiliation_sequence_number
-            )
+            author_affiliations = affiliations_by_sequence[author_sequence_no]
 
             original_affiliations = []
             if update_original_affiliations:
@@ -706,6 +736,7 @@ class Work(db.Model):
 
             self.concepts_input_hash = current_concepts_input_hash
 
+    @with_records_cache
     def add_everything(self, skip_concepts_and_related_works=False):
         self.delete_dict = defaultdict(list)
         self.insert_dicts = []
@@ -968,11 +999,9 @@ class Work(db.Model):
         self.full_updated_date = datetime.datetime.utcnow().isoformat()
         for record in self.records_merged:
             if record.abstract:
-                indexed_abstract = f_generate_inverted_index(record.abstract)
-                if len(indexed_abstract) >= 60000:
-                    # truncate the abstract if too long
-                    indexed_abstract = f_generate_inverted_index(
-                        record.abstract[0:30000])
+                # truncated while building if the index would be too long
+                indexed_abstract = generate_inverted_index(
+                    record.abstract, max_length=MAX_INDEXED_ABSTRACT_LENGTH)
                 insert_dict = {
                     "paper_id": self.paper_id,
                     "indexed_abstract": indexed_abstract
@@ -1619,8 +1648,39 @@ class Work(db.Model):
             if override_val:
                 setattr(self, work_field, override_val)
 
+    @contextmanager
+    def records_cache(self):
+        """
+        Memoize records_merged, records_sorted and affiliation_records_sorted
+        until the outermost block exits. Changes to self.records invalidate it.
+        """
+        is_outermost = getattr(self, '_records_cache', None) is None
+        if is_outermost:
+            self._records_cache = {}
+        try:
+            yield
+        finally:
+            if is_outermost:
+                self._records_cache = None
+
+    def invalidate_records_cache(self):
+        if getattr(self, '_records_cache', None) is not None:
+            self._records_cache = {}
+
+    def _cached_records_view(self, key, compute):
+        cache = getattr(self, '_records_cache', None)
+        if cache is None:
+            return compute()
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
     @property
     def records_sorted(self):
+        return self._cached_records_view('records_sorted',
+                                         self._records_sorted)
+
+    def _records_sorted(self):
         if not self.records_merged:
             return []
 
@@ -1644,11 +1704,19 @@ class Work(db.Model):
 
     @property
     def records_merged(self):
+        return self._cached_records_view('records_merged',
+                                         self._records_merged)
+
+    def _records_merged(self):
         return [r.with_parsed_data for r in self.records or [] if
                 r.with_parsed_data]
 
     @property
     def affiliation_records_sorted(self):
+        return self._cached_records_view('affiliation_records_sorted',
+                                         self._affiliation_records_sorted)
+
+    def _affiliation_records_sorted(self):
         records = [record for record in self.records_sorted if
                                      record.has_affiliations]
         if not records:
@@ -1735,61 +1803,67 @@ class Work(db.Model):
 
     @cached_property
     def affiliations_list(self):
-        affiliations = [affiliation for affiliation in self.affiliations_sorted]
-        if not affiliations:
+        return self.build_affiliations_list()
+
+    def build_affiliations_list(self):
+        """
+        Authorships for to_dict(), built in one pass over self.affiliations.
+        """
+        if not self.affiliations:
             return []
 
+        affiliations_by_sequence = defaultdict(list)
+        for affil in self.affiliations:
+            affiliations_by_sequence[affil.author_sequence_number].append(affil)
+
         # it seems like sometimes there are 0s and sometimes 1st, so figure out the minimum
-        first_author_sequence_number = min(
-            [affil.author_sequence_number for affil in affiliations])
-        last_author_sequence_number = max(
-            [affil.author_sequence_number for affil in affiliations])
-        affiliation_dict = defaultdict(list)
-        for affil in affiliations:
-            affil.author_position = "middle"
-            if affil.author_sequence_number == first_author_sequence_number:
-                affil.author_position = "first"
-            elif affil.author_sequence_number == last_author_sequence_number:
-                affil.author_position = "last"
-            affiliation_dict[affil.author_sequence_number] += [
-                affil.to_dict("minimum")]
+        author_sequence_numbers = sorted(affiliations_by_sequence.keys())
+        first_author_sequence_number = author_sequence_numbers[0]
+        last_author_sequence_number = author_sequence_numbers[-1]
+        is_single_author = len(author_sequence_numbers) == 1
+
         response = []
-        for seq, affil_list in affiliation_dict.items():
+        for seq in author_sequence_numbers:
+            author_position = "middle"
+            if seq == first_author_sequence_number:
+                author_position = "first"
+            elif seq == last_author_sequence_number:
+                author_position = "last"
+            affil_list = []
+            for affil in affiliations_by_sequence[seq]:
+                affil.author_position = author_position
+                affil_list.append(affil.to_dict("minimum"))
+
             institution_list = [a["institution"] for a in affil_list if
                                 a["institution"].get("id") is not None]
             # De-dupe by institution["id"]
             institution_list = list({i['id']: i for i in institution_list}.values())
-            if institution_list == [{}]:
-                institution_list = []
-            if len(affiliation_dict) == 1:
+            if is_single_author:
                 # override - single author is always corresponding
                 is_corresponding = True
             else:
                 is_corresponding = affil_list[0].get('is_corresponding_author',
                                                      False)
 
-            raw_affiliation_strings = sorted(list(set([
-                a.get("raw_affiliation_string") for a in affil_list
-                if a.get("raw_affiliation_string")
-            ])))
-            raw_affiliation_string = '; '.join(sorted(list(set([
-                a.get("raw_affiliation_string") for a in affil_list
+            raw_affiliation_strings = sorted(set(
+                a["raw_affiliation_string"] for a in affil_list
                 if a.get("raw_affiliation_string")
-            ]))))
+            ))
+            raw_affiliation_string = '; '.join(raw_affiliation_strings)
             # add countries
             if institution_list:
-                countries_list = [a["institution"]["country_code"] for a in
-                                  affil_list if a["institution"].get(
-                        "country_code") is not None]
-                countries = sorted(list(set(countries_list)))
-            elif not institution_list and raw_affiliation_string:
+                countries = sorted(set(
+                    a["institution"]["country_code"] for a in affil_list
+                    if a["institution"].get("country_code") is not None
+                ))
+            elif raw_affiliation_string:
                 countries = self.get_countries_from_raw_affiliation(
                     raw_affiliation_string)
             else:
                 countries = []
 
             response_dict = {
-                "author_position": affil_list[0]["author_position"],
+                "author_position": author_position,
                 "author": affil_list[0]["author"],
                 "institutions": institution_list,
                 "countries": countries,
@@ -1808,38 +1882,25 @@ class Work(db.Model):
         """
         Affiliations that are displayed within authorships in to_dict().
         """
-        affiliations = []
+        # keyed by (author_position, raw_affiliation_string), dicts keep insertion order
+        affiliations = {}
 
         for affil in affil_list:
-            author_position = affil.get("author_position")
-            institution_id = affil.get("institution", {}).get("id")
             raw_affiliation_string = affil.get("raw_affiliation_string")
+            if not raw_affiliation_string:
+                continue
+            institution_id = affil.get("institution", {}).get("id")
+            key = (affil.get("author_position"), raw_affiliation_string)
 
-            # find an existing entry with the same author_position and raw_affiliation_string
-            found = False
-            for affiliation in affiliations:
-                if (affiliation["author_position"] == author_position and
-                        affiliation[
-                            "raw_affiliation_string"] == raw_affiliation_string):
-                    if institution_id:
-                        affiliation["institution_ids"].append(institution_id)
-                    found = True
-                    break
-
-            # if no such entry exists, create a new one
-            if not found and raw_affiliation_string:
-                affiliations.append({
-                    "author_position": author_position,
+            if key not in affiliations:
+                affiliations[key] = {
                     "raw_affiliation_string": raw_affiliation_string,
-                    "institution_ids": [
-                        institution_id] if institution_id else []
-                })
-
-        # remove author_position, no longer needed
-        for affiliation in affiliations:
-            del affiliation["author_position"]
+                    "institution_ids": []
+                }
+            if institution_id:
+                affiliations[key]["institution_ids"].append(institution_id)
 
-        return affiliations
+        return list(affiliations.values())
 
     @cached_property
     def institutions_distinct(self):
@@ -1869,23 +1930,20 @@ class Work(db.Model):
 
     @classmethod
     def author_match_names_from_record_json(cls, record_author_json):
-        author_match_names = []
         if not record_author_json:
             return []
-        author_dict_list = json.loads(record_author_json)
+        return list(record_author_match_names(record_author_json))
 
-        for author_sequence_order, author_dict in enumerate(author_dict_list):
-            original_name = author_dict["raw"]
-            if author_dict["family"]:
-                original_name = "{} {}".format(author_dict["given"],
-                                               author_dict["family"])
-
-            raw_author_string = original_name if original_name else None
-            author_match_strings = models.Author.matching_author_strings(
-                raw_author_string)
-            if author_match_strings:
-                author_match_names.extend(author_match_strings)
-        return author_match_names
+    @cached_property
+    def first_last_author_match_strings(self):
+        # computed once per work, the same candidate work is checked against many records in a chunk
+        match_strings = []
+        for original_name in [self.first_author_original_name,
+                              self.last_author_original_name]:
+            if original_name:
+                match_strings.extend(
+                    models.Author.matching_author_strings(original_name))
+        return match_strings
 
     def matches_authors_in_record(self, record_author_json):
         # returns True if either of them are missing authors, or if the authors match
@@ -1903,23 +1961,15 @@ class Work(db.Model):
         logger.info(
             f"trying to match existing work {self.id} {self.doi_lower} with record authors")
 
-        for original_name in [self.first_author_original_name,
-                              self.last_author_original_name]:
-            logger.info(f"original_name: {original_name}")
-            if original_name:
-                author_match_strings = models.Author.matching_author_strings(
-                    original_name)
-                logger.info(f"author_match_strings: {author_match_strings}")
-                for author_match_string in author_match_strings:
-                    logger.info(f"author_match_string: {author_match_string}")
-                    match_names_from_record_json = Work.author_match_names_from_record_json(
-                        record_author_json)
-                    logger.info(
-                        f"match_names_from_record_json: {match_names_from_record_json}")
-                    if author_match_string and (
-                            author_match_string in match_names_from_record_json):
-                        logger.info("author match!")
-                        return True
+        match_names_from_record_json = record_author_match_names(
+            record_author_json)
+        logger.info(
+            f"author_match_strings: {self.first_last_author_match_strings}")
+        for author_match_string in self.first_last_author_match_strings:
+            if author_match_string and (
+                    author_match_string in match_names_from_record_json):
+                logger.info(f"author match! {author_match_string}")
+                return True
 
         logger.info("author no match")
         return False
@@ -2031,10 +2081,7 @@ class Work(db.Model):
         if self.journal and self.journal.language_override:
             return self.journal.language_override.language
 
-        abstract_words = []
-        if self.abstract and self.abstract.indexed_abstract:
-            json_abstract = json.loads(self.abstract.indexed_abstract)
-            abstract_words = list(json_abstract.get('InvertedIndex', {}).keys())
+        abstract_words = self.abstract.words if self.abstract else []
         return detect_language_from_abstract_and_title(abstract_words,
                                                        self.original_title)
 
@@ -2203,6 +2250,7 @@ class Work(db.Model):
                     sources.append("doaj")
         return sorted(list(set(sources)))
 
+    @with_records_cache
     def store(self):
         if not self.full_updated_date:
             return []
@@ -2247,8 +2295,6 @@ class Work(db.Model):
         bulk_actions = []
 
         my_dict = self.to_dict("full")
-        my_dict['updated'] = my_dict.get('updated_date')
-        my_dict['@timestamp'] = datetime.datetime.utcnow().isoformat()
         my_dict['@version'] = 1
         my_dict['authors_count'] = len(self.affiliations_list)
         my_dict['concepts_count'] = len(self.concepts_sorted)
@@ -2269,9 +2315,9 @@ class Work(db.Model):
                 my_dict['has_fulltext'] = True
                 my_dict['fulltext_origin'] = 'ngrams'
 
-        if len(my_dict.get('authorships', [])) > 100:
+        if len(my_dict.get('authorships', [])) > MAX_AUTHORSHIPS_INDEXED:
             my_dict['authorships_full'] = my_dict.get('authorships', [])
-            my_dict['authorships'] = my_dict.get('authorships', [])[0:100]
+            my_dict['authorships'] = my_dict.get('authorships', [])[0:MAX_AUTHORSHIPS_INDEXED]
             my_dict['authorships_truncated'] = True
 
         if self.is_closed_springer_or_elsevier:
@@ -2301,7 +2347,7 @@ class Work(db.Model):
                 "_op_type": "index",
                 "_index": f"{WORKS_INDEX_PREFIX}-{index_suffix}",
                 "_id": self.openalex_id,
-                "_source": my_dict
+                "_source": add_volatile_fields(my_dict)
             }
             bulk_actions.append(index_record)
 
@@ -2954,6 +3000,11 @@ def on_year_change(mapper, connection, target):
 event.listen(Work, 'before_update', on_year_change)
 
 
+def on_records_change(target, value, initiator):
+    # listener for Work.records, registered in models/__init__.py where the relationship is defined
+    target.invalidate_records_cache()
+
+
 class WorkFulltext(db.Model):
     __table_args__ = {'schema': 'mid'}
     __tablename__ = "work_fulltext"
@@ -29,6 +29,12 @@ class WorkType(db.Model):
     def openalex_id(self):
         return f"https://openalex.org/types/{self.id}"
 
+    elastic_count_key = "type"
+
+    @property
+    def elastic_count_id(self):
+        return self.id
+
     def store(self):
         bulk_actions, new_entity_hash = create_bulk_actions(self, WORK_TYPES_INDEX)
         self.json_entity_hash = new_entity_hash
@@ -44,7 +50,7 @@ class WorkType(db.Model):
                 "description": self.description if self.description else "",
                 "crossref_types": sorted(self.crossref_types) if self.crossref_types else [],
                 "works_count": works_count_from_api("type", self.openalex_id),
-                "cited_by_count": citation_count_from_elastic("type", self.id),
+                "cited_by_count": citation_count_from_elastic(self.elastic_count_key, self.elastic_count_id),
                 "works_api_url": f"https://api.openalex.org/works?filter=type:{self.id}",
                 "updated_date": datetime.datetime.utcnow().isoformat(),
                 "created_date": self.created_date.isoformat()[0:10] if isinstance(self.created_date, datetime.datetime) else self.created_date[0:10]
@@ -2,7 +2,9 @@ import argparse
 import json
 import os
 import traceback
+from collections import defaultdict
 from datetime import datetime
+from multiprocessing import Pool
 from time import time, sleep
 
 import requests
@@ -11,7 +13,7 @@ from sqlalchemy import text
 
 import models
 from app import REDIS_QUEUE_URL, logger, db
-from models import REDIS_ADD_THINGS_QUEUE
+from models import REDIS_ADD_THINGS_QUEUE, REDIS_ADD_THINGS_DEAD_LETTER_QUEUE
 from scripts.works_query import base_slow_queue_works_query
 from util import work_has_null_author_ids, elapsed, get_openalex_json
 
@@ -19,6 +21,7 @@ _redis = Redis.from_url(REDIS_QUEUE_URL)
 
 DEQUEUE_CHUNK_SIZE = 50
 SQL_ENQUEUE_CHUNK_SIZE = 100
+MAX_JOB_RETRIES = 3
 
 
 def parse_args():
@@ -38,6 +41,8 @@ def parse_args():
     parser.add_argument('-m', '--method', type=str,
                         help='Methods to run on Work objects', action='append',
                         dest='methods')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of worker processes running jobs concurrently')
     return parser.parse_args()
 
 
@@ -63,11 +68,28 @@ def dequeue_chunk(chunk_size):
     return [json.loads(item[0]) for item in items]
 
 
-def enqueue_fast_queue(works, priority=None):
+def requeue_failed_jobs(jobs):
+    # retry at the back of the queue, give up after MAX_JOB_RETRIES
+    retry_mapping = {}
+    dead_letter_mapping = {}
+    for job in jobs:
+        job = dict(job, retries=job.get('retries', 0) + 1)
+        if job['retries'] > MAX_JOB_RETRIES:
+            dead_letter_mapping[json.dumps(job)] = time()
+        else:
+            retry_mapping[json.dumps(job)] = time()
+    if retry_mapping:
+        _redis.zadd(REDIS_ADD_THINGS_QUEUE, retry_mapping)
+    if dead_letter_mapping:
+        logger.info(
+            f'moving {len(dead_letter_mapping)} jobs to {REDIS_ADD_THINGS_DEAD_LETTER_QUEUE}')
+        _redis.zadd(REDIS_ADD_THINGS_DEAD_LETTER_QUEUE, dead_letter_mapping)
+
+
+def enqueue_fast_queue(work_ids, priority=None):
     redis_queue_time = time() if priority is None else priority
     redis_queue_mapping = {
-        work.paper_id: redis_queue_time
-        for work in works if not work_has_null_author_ids(work)
+        work_id: redis_queue_time for work_id in work_ids
     }
     if redis_queue_mapping:
         _redis.zadd(models.REDIS_WORK_QUEUE, redis_queue_mapping)
@@ -75,6 +97,75 @@ def enqueue_fast_queue(works, priority=None):
         f'enqueueing works in redis work_store took {elapsed(redis_queue_time, 2)} seconds')
 
 
+def group_jobs(jobs, n_batches=1):
+    # jobs with the same methods and fast queue priority can share one works query
+    groups = defaultdict(list)
+    for job in jobs:
+        methods = tuple(job['methods'] or ['add_everything'])
+        groups[(methods, job.get('fast_queue_priority'))].append(job)
+
+    batches = []
+    for group in groups.values():
+        batch_size = -(-len(group) // n_batches)
+        batches += [group[i:i + batch_size] for i in
+                    range(0, len(group), batch_size)]
+    return batches
+
+
+def run_jobs(jobs):
+    """
+    Run a batch of jobs that share the same methods. All works are loaded in one query.
+    Returns (number of works processed, failed jobs, work ids to enqueue in the fast queue).
+    """
+    methods = jobs[0]['methods'] or ['add_everything']
+    jobs_map = {job['work_id']: job for job in jobs}
+    try:
+        works = base_slow_queue_works_query().filter(
+            models.Work.paper_id.in_(list(jobs_map.keys()))
+        ).all()
+    except Exception as e:
+        # these jobs are already popped from redis, hand them all back to be retried
+        logger.info(f'Exception while loading works, rolling back')
+        logger.exception(e)
+        db.session.rollback()
+        return 0, jobs, []
+
+    failed_jobs = []
+    for work in works:
+        for method_name in methods:
+            method = getattr(work, method_name)
+            fargs = []
+            if method_name == 'add_everything':
+                fargs = [True]
+            try:
+                method(*fargs)
+            except Exception as e:
+                logger.info(
+                    f'Exception calling {method_name}() on work {work.paper_id}')
+                logger.exception(e)
+                failed_jobs.append(jobs_map[work.paper_id])
+                break
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        logger.info(f'Exception while committing db changes, rolling back')
+        logger.exception(e)
+        db.session.rollback()
+        return len(works), jobs, []
+
+    failed_work_ids = {job['work_id'] for job in failed_jobs}
+    fast_queue_work_ids = [work.paper_id for work in works if
+                           work.paper_id not in failed_work_ids and
+                           not work_has_null_author_ids(work)]
+    return len(works), failed_jobs, fast_queue_work_ids
+
+
+def init_worker():
+    # we are in a fork, don't share the parent's db connections
+    db.engine.dispose()
+
+
 def enqueue_from_api(oa_filters, methods=None, fast_queue_priority=None):
     for oa_filter in oa_filters:
         logger.info(f'[*] Starting to enqueue using OA filter: {oa_filter}')
@@ -193,9 +284,10 @@ def main():
     total_processed = 0
     errors_count = 0
     start = datetime.now()
+    pool = Pool(args.workers, initializer=init_worker) if args.workers > 1 else None
     while True:
         try:
-            jobs = dequeue_chunk(DEQUEUE_CHUNK_SIZE)
+            jobs = dequeue_chunk(DEQUEUE_CHUNK_SIZE * args.workers)
         except Exception as e:
             logger.info('Exception during dequeue, exiting...')
             logger.exception(e)
@@ -205,48 +297,29 @@ def main():
                 f'No jobs found in {REDIS_ADD_THINGS_QUEUE}, sleeping and then checking again')
             sleep(10)
             continue
-        jobs_map = {job['work_id']: job for job in jobs}
-        works = base_slow_queue_works_query().filter(
-            models.Work.paper_id.in_([job['work_id'] for job in jobs])
-        ).all()
 
-        for work in works:
-            job = jobs_map[work.paper_id]
-            if not job['methods']:
-                job['methods'] = ['add_everything']
-            for method_name in job['methods']:
-                method = getattr(work, method_name)
-                fargs = []
-                if method_name == 'add_everything':
-                    fargs = [True]
-                try:
-                    method(*fargs)
-                except Exception as e:
-                    logger.info(
-                        f'Exception calling {method_name}() on work {work.paper_id}')
-                    logger.exception(e)
-                    # Re-queue job
-                    enqueue_job(work.paper_id, 1e9, job['methods'],
-                                job.get('fast_queue_priority'))
-                    errors_count += 1
-            total_processed += 1
-        now = datetime.now()
-        try:
-            db.session.commit()
-        except Exception as e:
-            logger.info(f'Exception while committing db changes, rolling back')
-            logger.exception(e)
-            db.session.rollback()
-        if not args.skip_fast_enqueue:
-            enqueue_fast_queue(works, priority=job.get('fast_queue_priority'))
+        batches = group_jobs(jobs, args.workers)
+        if pool:
+            results = pool.map(run_jobs, batches)
         else:
-            logger.info(f'Skipping priority enqueue to fast queue')
+            results = [run_jobs(batch) for batch in batches]
+
+        for batch, (processed, failed_jobs, fast_queue_work_ids) in zip(batches, results):
+            total_processed += processed
+            errors_count += len(failed_jobs)
+            requeue_failed_jobs(failed_jobs)
+            if not args.skip_fast_enqueue:
+                enqueue_fast_queue(fast_queue_work_ids,
+                                   priority=batch[0].get('fast_queue_priority'))
+            else:
+                logger.info(f'Skipping priority enqueue to fast queue')
+
+        now = datetime.now()
         hrs_diff = (now - start).total_seconds() / (60 * 60)
         rate = round(total_processed / hrs_diff, 2)
         count_in_queue = _redis.zcard(REDIS_ADD_THINGS_QUEUE)
         logger.info(
-            f'Total processed: {total_processed} | Rate: {rate}/hr | Errors: {errors_count} | Count in queue: {count_in_queue} | Last work processed: {works[-1].paper_id}')
-
+            f'Total processed: {total_processed} | Rate: {rate}/hr | Errors: {errors_count} | Count in queue: {count_in_queue} | Batches: {len(batches)}')
 
 if __name__ == '__main__':
     main()
@@ -1,14 +1,21 @@
 import argparse
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import getenv
 from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
+from psycopg2 import sql
 from urllib.parse import urlparse
 from time import time
 
 from util import elapsed
 
 # python -m scripts.copy_s3_to_postgres mid.work_extra_ids
+# python -m scripts.copy_s3_to_postgres mid.work_extra_ids --workers 8 --defer_indexes
+# load pipe-delimited part files from a local directory instead of s3:
+# python -m scripts.copy_s3_to_postgres mid.work_extra_ids --local_dir /tmp/mid_work_extra_ids
 
 postgres_url = urlparse(getenv("POSTGRES_URL"))
 
@@ -32,62 +39,154 @@ def get_postgres_cursor(readonly=False):
       cursor.close()
       pass
 
-if __name__ == '__main__':
-    ap = argparse.ArgumentParser()
-    ap.add_argument('table', help='tablename')
-    # ap.add_argument('--threads', '-t', nargs='?', type=int, default=1, help='number of tables to concatenate in parallel')
 
-    parsed = ap.parse_args()
-    # run(parsed.bucket, parsed.prefix, parsed.delete, parsed.dry_run, parsed.threads)
-    start_time = time()
+_thread_connections = threading.local()
+
+
+def thread_connection():
+    # one connection per worker thread, reused for all the parts it loads
+    if getattr(_thread_connections, "connection", None) is None:
+        _thread_connections.connection = new_postgres_connection(readonly=False)
+    return _thread_connections.connection
+
+
+def max_parts(table_name):
+    if table_name == "mid.json_works":
+        return 10
+    elif table_name == "mid.json_authors":
+        return 3
+    elif table_name == "ins.unpaywaLl_recordthresher_fields_mv":
+        return 2
+    return 1
+
 
-    aws_access_key_id = getenv("AWS_ACCESS_KEY_ID")
-    aws_secret_access_key = getenv("AWS_SECRET_ACCESS_KEY")
-    table_name = parsed.table
+def s3_parts(table_name):
     folder_name = table_name.replace(".", "_", 1)
+    return [
+        f"export-rds/{folder_name}/{i:0>4}_part_{j:0>2}"
+        for i in range(0, 32) for j in range(0, max_parts(table_name))
+    ]
+
+
+def local_parts(local_dir):
+    return sorted(
+        os.path.join(local_dir, name) for name in os.listdir(local_dir)
+        if os.path.isfile(os.path.join(local_dir, name))
+    )
+
+
+def import_part_from_s3(cursor, table_name, part):
+    cursor.execute(
+        """SELECT aws_s3.table_import_from_s3(
+           %s,
+           '',
+           '(delimiter $$|$$, null $$$$)',
+           aws_commons.create_s3_uri('openalex-sandbox', %s, 'us-east-1'),
+           aws_commons.create_aws_credentials(%s, %s, '')
+        );""",
+        (table_name, part, getenv("AWS_ACCESS_KEY_ID"), getenv("AWS_SECRET_ACCESS_KEY"))
+    )
+    # like "1000 rows imported into relation ..."
+    result = cursor.fetchone()[0]
+    return int(result.split()[0]) if result and result.split()[0].isdigit() else None
+
+
+def import_part_from_file(cursor, table_name, part):
+    copy_sql = sql.SQL("COPY {} FROM STDIN WITH (delimiter '|', null '')").format(
+        sql.Identifier(*table_name.split("."))
+    )
+    with open(part) as f:
+        cursor.copy_expert(copy_sql, f)
+    return cursor.rowcount
+
+
+def import_part(table_name, part, local):
+    part_start = time()
+    cursor = thread_connection().cursor()
+    try:
+        if local:
+            rows = import_part_from_file(cursor, table_name, part)
+        else:
+            rows = import_part_from_s3(cursor, table_name, part)
+    finally:
+        cursor.close()
+    part_time = elapsed(part_start)
+    rate = f"{round(rows / part_time)} rows/s" if rows and part_time else "unknown rate"
+    print(f"imported {part}: {rows} rows in {part_time}s, {rate}")
+    return rows or 0
 
-    for i in range(0, 32):
-        max_part = 1
-        if table_name == "mid.json_works":
-            max_part = 10
-        elif table_name == "mid.json_authors":
-            max_part = 3
-        elif table_name == "ins.unpaywaLl_recordthresher_fields_mv":
-            max_part = 2
-        for j in range(0, max_part):
-
-            loop_time = time()
-            print(f"loop number {i}")
-            q2 = f"""analyze {table_name};
-                    SELECT reltuples::bigint AS estimate
-                    FROM   pg_class
-                    WHERE  oid = '{table_name}'::regclass;
-                    """
-            print(q2)
-            q = f"""SELECT aws_s3.table_import_from_s3(
-               '{table_name}',
-               '', 
-               '(delimiter $$|$$, null $$$$)',
-               aws_commons.create_s3_uri(
-                       'openalex-sandbox',
-                       'export-rds/{folder_name}/{i:0>4}_part_{j:0>2}',
-                       'us-east-1'
-                    ),
-               aws_commons.create_aws_credentials(
-               '{aws_access_key_id}', '{aws_secret_access_key}', '')
-            );"""
-            print(q)
-            with get_postgres_cursor() as cur:
-                cur.execute(q2)
-                rows = cur.fetchall()
-                print(f"done, {rows}")
-                cur.execute(q)
-
-            print(f"loop time {elapsed(loop_time)}s, per loop time {elapsed(start_time)/(i+1)}s, total_time {elapsed(start_time)}s")
-
-    # final print of size
+
+def drop_indexes(table_name):
+    # keep indexes that back constraints, dropping those would change the table definition
+    schema, name = table_name.split(".")
+    with get_postgres_cursor() as cur:
+        cur.execute(
+            """SELECT indexname, indexdef FROM pg_indexes i
+               WHERE schemaname = %s AND tablename = %s
+               AND NOT EXISTS (
+                   SELECT 1 FROM pg_constraint c
+                   WHERE c.conindid = format('%%I.%%I', i.schemaname, i.indexname)::regclass
+               )""",
+            (schema, name)
+        )
+        indexes = cur.fetchall()
+        # printed before anything is dropped, so they can be recreated by hand if this run dies
+        print(f"index definitions for {table_name}:")
+        for index in indexes:
+            print(f"{index['indexdef']};")
+        for index in indexes:
+            print(f"dropping index {index['indexname']}")
+            cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(schema, index["indexname"])))
+    return [index["indexdef"] for index in indexes]
+
+
+def create_indexes(index_defs):
+    for index_def in index_defs:
+        index_start = time()
+        print(index_def)
+        with get_postgres_cursor() as cur:
+            cur.execute(index_def)
+        print(f"built index in {elapsed(index_start)}s")
+
+
+def load_table(table_name, workers=1, local_dir=None, defer_indexes=False):
+    start_time = time()
+    parts = local_parts(local_dir) if local_dir else s3_parts(table_name)
+    print(f"importing {len(parts)} parts into {table_name} with {workers} workers")
+
+    index_defs = drop_indexes(table_name) if defer_indexes else []
+
+    total_rows = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(import_part, table_name, part, bool(local_dir)) for part in parts]
+            for done_count, future in enumerate(as_completed(futures), 1):
+                total_rows += future.result()
+                print(f"{done_count}/{len(parts)} parts done, {total_rows} rows, total_time {elapsed(start_time)}s")
+    finally:
+        # rebuild even if a part failed, the table shouldn't be left without its indexes
+        if index_defs:
+            create_indexes(index_defs)
+
+    # one analyze at the end instead of before every part
     with get_postgres_cursor() as cur:
-        cur.execute(q2)
+        cur.execute(sql.SQL("analyze {}").format(sql.Identifier(*table_name.split("."))))
+        cur.execute(
+            "SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = %s::regclass",
+            (table_name,)
+        )
         rows = cur.fetchall()
         print(f"done, {rows}")
-        print(f"loop time {elapsed(loop_time)}s, total_time {elapsed(start_time)}s")
+
+    print(f"imported {total_rows} rows, total_time {elapsed(start_time)}s")
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('table', help='tablename')
+    ap.add_argument('--workers', '-w', nargs='?', type=int, default=1, help='number of parts to import in parallel')
+    ap.add_argument('--local_dir', nargs='?', type=str, help='import the files in this directory instead of the s3 parts')
+    ap.add_argument('--defer_indexes', action='store_true', help='drop indexes before importing and rebuild them after')
+
+    parsed = ap.parse_args()
+    load_table(parsed.table, parsed.workers, parsed.local_dir, parsed.defer_indexes)
@@ -1,6 +1,7 @@
 from time import mktime, gmtime
 
 from redis import Redis
+from sqlalchemy import text
 
 from app import REDIS_QUEUE_URL
 from app import db
@@ -17,19 +18,44 @@ class WorkToEnqueue(db.Model):
     paper_id = db.Column(db.BigInteger, primary_key=True)
 
 
-if __name__ == "__main__":
-    paper_ids = [r[0] for r in db.session.query(WorkToEnqueue.paper_id).all()]
+def enqueue_chunk(chunk_size, zadd_batch_size):
+    # delete a chunk and queue exactly the deleted ids. if the zadds fail the delete is rolled back,
+    # and if we die after the zadds but before the commit the ids are just queued again next time.
+    paper_ids = [
+        row[0] for row in db.session.execute(
+            text('''
+                delete from authorships.works_to_enqueue
+                where paper_id in (
+                    select paper_id from authorships.works_to_enqueue
+                    limit :chunk_size
+                    for update skip locked
+                )
+                returning paper_id
+            ''').bindparams(chunk_size=chunk_size)
+        ).fetchall()
+    ]
+
     if paper_ids:
-        num_paper_ids = len(paper_ids)
-        logger.info(f'got {num_paper_ids} works to queue')
-        queue_chunk_size = 100000
+        queue_time = mktime(gmtime(0))
+        pipe = _redis.pipeline(transaction=False)
+        for i in range(0, len(paper_ids), zadd_batch_size):
+            pipe.zadd(REDIS_WORK_QUEUE, {paper_id: queue_time for paper_id in paper_ids[i:i + zadd_batch_size]})
+        pipe.execute()
+
+    db.session.commit()
+    return len(paper_ids)
+
+
+if __name__ == "__main__":
+    queue_chunk_size = 100000
+    zadd_batch_size = 10000
+    total = 0
 
-        for i in range(0, num_paper_ids, queue_chunk_size):
-            redis_queue_mapping = {paper_id: mktime(gmtime(0)) for paper_id in paper_ids[i:i+queue_chunk_size]}
-            logger.info(f'queueing works {i} - {i+queue_chunk_size}')
-            _redis.zadd(REDIS_WORK_QUEUE, redis_queue_mapping)
+    while num_queued := enqueue_chunk(queue_chunk_size, zadd_batch_size):
+        total += num_queued
+        logger.info(f'queued {num_queued} works, {total} so far')
 
-        WorkToEnqueue.query.delete()
-        db.session.commit()
+    if total:
+        logger.info(f'queued {total} works')
     else:
         logger.info('no works to queue')
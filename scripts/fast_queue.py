@@ -1,6 +1,7 @@
 import argparse
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from random import random
 from time import sleep, time
 
 from elasticsearch import Elasticsearch
@@ -15,6 +16,7 @@ from app import REDIS_QUEUE_URL
 from app import db
 from app import logger
 from models import REDIS_WORK_QUEUE
+from models.counts import elastic_client, prefetch_elastic_counts
 from scripts.works_query import base_fast_queue_works_query
 from util import elapsed
 
@@ -59,60 +61,87 @@ def run(**kwargs):
         objects_updated = 0
         limit = kwargs.get('limit')
         chunk = kwargs.get('chunk')
-        total_count = 0
 
         while limit is None or objects_updated < limit:
-            loop_start = time()
-            if object_ids := fetch_queue_chunk_ids(queue_table, chunk):
-                objects = get_objects(entity_type, object_ids)
-                bulk_actions = []
-
-                for obj in objects:
-                    method_start_time = time()
-                    total_count += 1
-
-                    print(f"*** #{total_count} starting {obj}.{method_name}() method")
-
-                    method_name = method_name.replace("update_once_", "")
-                    method_to_run = getattr(obj, method_name)
-                    record_actions = method_to_run()
-                    if method_name == "store" and record_actions:
-                        for bulk_action in record_actions:
-                            bulk_actions.append(bulk_action)
-
-                    logger.info(f">>> finished {obj}.{method_name}(). took {elapsed(method_start_time, 4)} seconds")
-
-                if kwargs.get('show_difference'):
-                    show_difference(bulk_actions)
-
-                logger.info('committing')
-                start_time = time()
-                db.session.commit()  # fail loudly for now
-                logger.info(f'commit took {elapsed(start_time, 4)}s')
-
-                if method_name == "store" and bulk_actions:
-                    logger.info('indexing')
-                    start_time = time()
-                    index_and_merge_object_records(bulk_actions)
-                    logger.info(f'indexing took {elapsed(start_time, 4)}s')
-
-                if entity_type == 'work' and method_name == 'store' and not queue_table_override:
-                    log_work_store_time(loop_start, time(), chunk)
-                elif queue_table == 'queue.work_authors_changed_store':
-                    remove_object_ids_from_queue(queue_table, object_ids)
-                    # push to back of redis queue, ensures the work gets added to fast queue!
-                    _redis.zadd(REDIS_WORK_QUEUE, {work_id: time() for work_id in object_ids})
-                else:
-                    update_object_ids_in_queue(queue_table, object_ids)
-
-                objects_updated += len(objects)
-
-                logger.info(f'processed chunk of {chunk} objects in {elapsed(loop_start, 2)} seconds')
+            if objects_processed := process_queue_chunk(
+                entity_type, method_name, queue_table, chunk,
+                queue_table_override=queue_table_override,
+                show_diff=kwargs.get('show_difference'),
+                total_count=objects_updated
+            ):
+                objects_updated += objects_processed
             else:
                 logger.info('nothing ready in the queue, waiting 5 seconds...')
                 sleep(5)
 
 
+def process_queue_chunk(
+        entity_type, method_name, queue_table, chunk,
+        queue_table_override=None, show_diff=False, total_count=0
+):
+    """
+    Claim one chunk from queue_table, run method_name on each object and index the results.
+    Returns the number of objects processed, 0 if nothing was ready in the queue.
+    """
+    loop_start = time()
+    object_ids = fetch_queue_chunk_ids(queue_table, chunk)
+    if not object_ids:
+        return 0
+
+    objects = get_objects(entity_type, object_ids)
+    bulk_actions = []
+
+    if method_name == "store":
+        start_time = time()
+        prefetch_elastic_counts(objects)
+        logger.info(f'prefetched elastic counts in {elapsed(start_time, 4)}s')
+        if entity_type in ("institution", "publisher", "funder"):
+            start_time = time()
+            models.prefetch_roles(objects)
+            logger.info(f'prefetched roles in {elapsed(start_time, 4)}s')
+
+    method_name = method_name.replace("update_once_", "")
+    for obj in objects:
+        method_start_time = time()
+        total_count += 1
+
+        print(f"*** #{total_count} starting {obj}.{method_name}() method")
+
+        method_to_run = getattr(obj, method_name)
+        record_actions = method_to_run()
+        if method_name == "store" and record_actions:
+            for bulk_action in record_actions:
+                bulk_actions.append(bulk_action)
+
+        logger.info(f">>> finished {obj}.{method_name}(). took {elapsed(method_start_time, 4)} seconds")
+
+    if show_diff:
+        show_difference(bulk_actions)
+
+    logger.info('committing')
+    start_time = time()
+    db.session.commit()  # fail loudly for now
+    logger.info(f'commit took {elapsed(start_time, 4)}s')
+
+    if method_name == "store" and bulk_actions:
+        logger.info('indexing')
+        start_time = time()
+        index_and_merge_object_records(bulk_actions)
+        logger.info(f'indexing took {elapsed(start_time, 4)}s')
+
+    if entity_type == 'work' and method_name == 'store' and not queue_table_override:
+        log_work_store_time(loop_start, time(), chunk)
+    elif queue_table == 'queue.work_authors_changed_store':
+        remove_object_ids_from_queue(queue_table, object_ids)
+        # push to back of redis queue, ensures the work gets added to fast queue!
+        _redis.zadd(REDIS_WORK_QUEUE, {work_id: time() for work_id in object_ids})
+    else:
+        update_object_ids_in_queue(queue_table, object_ids)
+
+    logger.info(f'processed chunk of {chunk} objects in {elapsed(loop_start, 2)} seconds')
+    return len(objects)
+
+
 def log_work_store_time(started, finished, chunk_size):
     text_query = f"""
         insert into log.work_store_batch (started, finished, batch_size)
@@ -127,9 +156,8 @@ def log_work_store_time(started, finished, chunk_size):
 
 
 def index_and_merge_object_records(bulk_actions):
-    es = Elasticsearch([ELASTIC_URL], timeout=30)
     try:
-        bulk(es, bulk_actions)
+        bulk(elastic_client(), bulk_actions)
     except BulkIndexError as e:
         for error in e.errors:
             # check if the error is due to a 'not_found' status when trying to delete
@@ -168,18 +196,28 @@ def fetch_queue_chunk_ids_from_redis(queue_table, chunk_size):
     return chunk
 
 
-def fetch_queue_chunk_ids_from_pg(queue_table, chunk_size):
-    order_by_clause = "finished asc nulls first, rand"
-    if queue_table == "queue.work_authors_changed_store":
-        # get new ids first, for when queue is backed up
-        order_by_clause = "id desc"
+# each claim is an index range scan, given:
+# create index on queue.<entity>_store (rand) where started is null and finished is null;
+# create index on queue.<entity>_store (finished) where started is null;
+# alter table queue.<entity>_store alter column rand set default random();
+# unfinished rows are taken in rand order starting from a random point, so parallel workers
+# start in different places instead of all skipping the same locked rows.
+CLAIM_FILTERS = [
+    ("finished is null and rand >= :start_rand", "rand"),
+    ("finished is null and rand < :start_rand", "rand"),
+    ("finished is null and rand is null", "id"),
+    ("finished < now() - '1 hour'::interval", "finished"),
+]
 
+
+def claim_queue_ids(queue_table, chunk_size, claim_filter, order_by_clause, **params):
+    params = {k: v for k, v in params.items() if f':{k}' in claim_filter}
     text_query = f"""
               with chunk as (
                   select id
                   from {queue_table}
                   where started is null
-                  and (finished is null or finished < now() - '1 hour'::interval)
+                  and {claim_filter}
                   order by {order_by_clause}
                   limit :chunk
                   for update skip locked
@@ -191,13 +229,31 @@ def fetch_queue_chunk_ids_from_pg(queue_table, chunk_size):
               returning chunk.id;
         """
 
+    return [
+        row[0] for row in
+        db.engine.execute(text(text_query).bindparams(chunk=chunk_size, **params).execution_options(autocommit=True)).all()
+    ]
+
+
+def fetch_queue_chunk_ids_from_pg(queue_table, chunk_size):
     logger.info(f'getting {chunk_size} ids from the queue')
     start_time = time()
 
-    ids = [
-        row[0] for row in
-        db.engine.execute(text(text_query).bindparams(chunk=chunk_size).execution_options(autocommit=True)).all()
-    ]
+    if queue_table == "queue.work_authors_changed_store":
+        # get new ids first, for when queue is backed up
+        ids = claim_queue_ids(
+            queue_table, chunk_size,
+            "(finished is null or finished < now() - '1 hour'::interval)", "id desc"
+        )
+    else:
+        ids = []
+        start_rand = random()
+        for claim_filter, order_by_clause in CLAIM_FILTERS:
+            if len(ids) >= chunk_size:
+                break
+            ids += claim_queue_ids(
+                queue_table, chunk_size - len(ids), claim_filter, order_by_clause, start_rand=start_rand
+            )
 
     logger.info(f'got {len(ids)} ids from the queue in {elapsed(start_time, 4)}s')
     logger.info(f'got these ids: {ids}')
@@ -287,6 +343,7 @@ def get_objects(entity_type, object_ids):
             selectinload(models.Institution.repositories).selectinload(models.Source.institution).raiseload('*'),
             selectinload(models.Institution.repositories).raiseload('*'),
         ).filter(models.Institution.affiliation_id.in_(object_ids)).all()
+        models.Institution.prefetch_ror_data(objects)
 
         # 
     elif entity_type == "concept":
@@ -0,0 +1,156 @@
+import argparse
+import resource
+import threading
+from random import choices
+from time import sleep, time
+
+from sqlalchemy import text
+
+from app import db
+from app import logger
+from models import REDIS_WORK_QUEUE
+from scripts.fast_queue import _redis, process_queue_chunk
+from util import elapsed
+
+
+"""
+Runs several fast_queue loops in one process, so they share one import of models, one DB pool
+and the same Elasticsearch and Redis clients instead of each paying for their own.
+
+Each queue is entity:method[:chunk[:queue_table]]. Worker threads pick the next queue to claim a chunk
+from at random, weighted by how many rows are waiting in each one.
+
+heroku local:run python -- -m scripts.fast_queue_multi --threads=4 --queues source:store:1 publisher:store:1 funder:store:1
+
+Every STATS_INTERVAL seconds it logs objects/sec, max RSS and DB pool status, which is what to compare
+against the same queues running as separate fast_queue processes.
+"""
+
+DEPTH_REFRESH_SECONDS = 60
+STATS_INTERVAL = 60
+
+
+class QueueLoop:
+    def __init__(self, spec, default_chunk):
+        parts = spec.split(":")
+        self.entity_type = parts[0]
+        self.method_name = parts[1] if len(parts) > 1 else "store"
+        self.chunk = int(parts[2]) if len(parts) > 2 and parts[2] else default_chunk
+        self.queue_table_override = parts[3] if len(parts) > 3 else None
+        self.queue_table = self.queue_table_override or f"queue.{self.entity_type.lower()}_store"
+        self.depth = 1
+        self.objects_processed = 0
+
+    def fetch_depth(self):
+        if self.queue_table == "queue.work_store":
+            return _redis.zcard(REDIS_WORK_QUEUE)
+
+        return db.session.execute(text(f"""
+            select count(*) from {self.queue_table}
+            where started is null
+            and (finished is null or finished < now() - '1 hour'::interval)
+        """)).scalar()
+
+    def __repr__(self):
+        return f"<QueueLoop {self.entity_type}.{self.method_name} {self.queue_table} chunk={self.chunk}>"
+
+
+class MultiQueueRunner:
+    def __init__(self, loops):
+        self.loops = loops
+        self.lock = threading.Lock()
+        self.depths_refreshed = 0
+        self.start_time = time()
+
+    def refresh_depths(self):
+        with self.lock:
+            if time() - self.depths_refreshed < DEPTH_REFRESH_SECONDS:
+                return
+            self.depths_refreshed = time()
+
+        for loop in self.loops:
+            try:
+                loop.depth = loop.fetch_depth()
+            except Exception as e:
+                logger.exception(f"error getting queue depth for {loop}: {e}")
+                db.session.rollback()
+        db.session.commit()
+        logger.info(f"queue depths: {', '.join(f'{loop.queue_table} {loop.depth}' for loop in self.loops)}")
+
+    def next_loop(self):
+        self.refresh_depths()
+        weights = [loop.depth for loop in self.loops]
+        if not any(weights):
+            return None
+        return choices(self.loops, weights=weights)[0]
+
+    def work(self, limit):
+        try:
+            while limit is None or self.total_processed() < limit:
+                loop = self.next_loop()
+                if loop is None:
+                    logger.info('nothing ready in any queue, waiting 5 seconds...')
+                    sleep(5)
+                    continue
+
+                try:
+                    if objects_processed := process_queue_chunk(
+                        loop.entity_type, loop.method_name, loop.queue_table, loop.chunk,
+                        queue_table_override=loop.queue_table_override,
+                    ):
+                        with self.lock:
+                            loop.objects_processed += objects_processed
+                    else:
+                        # empty until the next depth refresh says otherwise
+                        loop.depth = 0
+                except Exception as e:
+                    # one bad chunk shouldn't stop the other queues in this process
+                    logger.exception(f"error processing chunk from {loop}: {e}")
+                    db.session.rollback()
+        finally:
+            db.session.remove()
+
+    def total_processed(self):
+        return sum(loop.objects_processed for loop in self.loops)
+
+    def log_stats(self):
+        seconds = max(elapsed(self.start_time), 0.001)
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        logger.info(
+            f"processed {self.total_processed()} objects, {round(self.total_processed() / seconds, 2)}/sec, "
+            f"max rss {max_rss_mb}MB, db pool: {db.engine.pool.status()}, "
+            f"per queue: {', '.join(f'{loop.queue_table} {loop.objects_processed}' for loop in self.loops)}"
+        )
+
+
+def run(queues, threads, chunk, limit=None):
+    loops = [QueueLoop(spec, chunk) for spec in queues]
+    logger.info(f"running {loops} on {threads} threads")
+    runner = MultiQueueRunner(loops)
+
+    workers = [
+        threading.Thread(target=runner.work, args=(limit,), name=f"fast_queue_{i}", daemon=True)
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(timeout=STATS_INTERVAL / threads)
+        runner.log_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several fast queues in one process.")
+    parser.add_argument(
+        '--queues', nargs="+", required=True, help="queues to run, as entity:method[:chunk[:queue_table]]"
+    )
+    parser.add_argument('--threads', "-t", type=int, default=4, help="how many chunks to work on at once")
+    parser.add_argument(
+        '--chunk', "-ch", type=int, default=1, help="chunk size for queues that don't set their own"
+    )
+    parser.add_argument('--limit', "-l", type=int, help="how many objects to work on, across all queues")
+
+    parsed_args = parser.parse_args()
+    run(parsed_args.queues, parsed_args.threads, parsed_args.chunk, parsed_args.limit)
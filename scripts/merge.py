@@ -1,6 +1,6 @@
 import argparse
-from sqlalchemy import orm
-from sqlalchemy.orm import selectinload
+from redis.client import Redis
+from sqlalchemy import orm, text
 from os import getenv
 from urllib.parse import urlparse
 from time import time
@@ -8,11 +8,16 @@ import datetime
 import sys
 
 import models
-from app import db
+from app import db, REDIS_QUEUE_URL
 from merge.merge_institution import process_institution as merge_one_institution
+from scripts.refresh_entity_concept_counts import refresh_entities
 
 from util import elapsed
 
+_redis = Redis.from_url(REDIS_QUEUE_URL)
+
+MERGE_CHUNK_SIZE = 5000
+
 # python -m scripts.merge source --away=2764397475 --into=190099528
 # python -m scripts.merge institution --away=19744281 --into=74796645
 
@@ -53,27 +58,9 @@ def run(entity, merge_away_id, merge_into_id):
     merge_away_obj.citation_count = 0
     merge_away_obj.full_updated_date = now
 
-    if entity == "source":
-        work_objects = models.Work.query.options(orm.Load(models.Work).raiseload('*')
-                                                 ).filter(models.Work.journal_id==merge_away_id).all()
-        print(f"updating journal_id for {len(work_objects)} works")
-        for work_obj in work_objects:
-            work_obj.journal_id = merge_into_id
-            work_obj.updated_date = now
-            work_obj.full_updated_date = now
-    elif entity == "author":
-        affiliation_objects = models.Affiliation.query.options(selectinload(models.Affiliation.work).raiseload('*'),
-                                                               selectinload(models.Affiliation.author).raiseload('*'),
-                                                               orm.Load(models.Affiliation).raiseload('*')
-                                                               ).filter(models.Affiliation.author_id==merge_away_id).all()
-        print(f"updating author_id for {len(affiliation_objects)} works")
-        for affil_obj in affiliation_objects:
-            affil_obj.author_id = merge_into_id
-            affil_obj.updated_date = now
-            if affil_obj.work:
-                affil_obj.work.full_updated_date = now
-            if affil_obj.author:
-                affil_obj.author.full_updated_date = now
+    if entity in ("source", "author"):
+        db.session.commit()
+        merge_set_based(entity, merge_away_id, merge_into_id, now)
     elif entity == "work":
         merge_away_work_object = models.Work.query.get(merge_away_id)
         print(f"updating work_object {merge_away_work_object}")
@@ -137,6 +124,85 @@ def run(entity, merge_away_id, merge_into_id):
     print("done\n")
 
 
+def merge_set_based(entity, merge_away_id, merge_into_id, now):
+    """
+    Repoint a source's works or an author's affiliations in chunked UPDATEs, committing each chunk,
+    so memory use doesn't grow with the number of rows. Touched works are enqueued for store.
+    """
+    if entity == "source":
+        chunk_sql = """
+            with chunk as (
+                select paper_id from mid.work
+                where journal_id = :away
+                limit :chunk
+                for update
+            )
+            update mid.work
+            set journal_id = :into, updated_date = :now, full_updated_date = :now
+            from chunk
+            where mid.work.paper_id = chunk.paper_id
+            returning mid.work.paper_id
+        """
+    else:
+        chunk_sql = """
+            with chunk as (
+                select paper_id, author_sequence_number, affiliation_sequence_number from mid.affiliation
+                where author_id = :away
+                limit :chunk
+                for update
+            )
+            update mid.affiliation
+            set author_id = :into, updated_date = :now
+            from chunk
+            where mid.affiliation.paper_id = chunk.paper_id
+            and mid.affiliation.author_sequence_number = chunk.author_sequence_number
+            and mid.affiliation.affiliation_sequence_number = chunk.affiliation_sequence_number
+            returning mid.affiliation.paper_id
+        """
+
+    total_rows = 0
+    total_works = 0
+    while True:
+        start = time()
+        rows = db.session.execute(
+            text(chunk_sql),
+            {"away": merge_away_id, "into": merge_into_id, "now": now, "chunk": MERGE_CHUNK_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        work_ids = list({row[0] for row in rows})
+        if entity == "author":
+            db.session.execute(
+                text("update mid.work set full_updated_date = :now where paper_id = any(:work_ids)"),
+                {"now": now, "work_ids": work_ids}
+            )
+        db.session.commit()
+        _redis.zadd(models.REDIS_WORK_QUEUE, {work_id: time() for work_id in work_ids})
+
+        total_rows += len(rows)
+        total_works += len(work_ids)
+        print(f"updated {total_rows} {'works' if entity == 'source' else 'affiliations'} so far, "
+              f"last chunk in {elapsed(start, 2)} seconds")
+
+    # both entities need a new store too
+    db.session.execute(
+        text(f"""
+            insert into queue.{entity}_store (id) (
+                select unnest(cast(:ids as bigint[]))
+            )
+            on conflict (id)
+            do update set finished = null
+        """),
+        {"ids": [merge_away_id, merge_into_id]}
+    )
+    db.session.commit()
+    print(f"enqueued {total_works} works and both {entity}s for store")
+
+    if entity == "source":
+        # the moved works' concepts go with them, and the incremental refresh only sees the new journal_id
+        refresh_entities("source", [merge_away_id, merge_into_id])
+
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
@@ -0,0 +1,142 @@
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import requests
+from sqlalchemy import text
+
+from app import USER_AGENT
+from app import db
+from app import logger
+from util import elapsed
+
+
+"""
+Fills wikipedia_json and wikidata_json for institutions and concepts that have a wikipedia page or
+wikidata id but no stored data yet, then queues them for store. Store only reads the stored json,
+so this is the only place Wikipedia and Wikidata are called.
+
+heroku local:run python -- -m scripts.prefetch_wiki_data --entity=institution --workers=4
+
+Concept data is saved to mid.concept_metadata and reaches mid.concept_api_mv when that is refreshed.
+"""
+
+CHUNK_SIZE = 100
+
+# entity -> query for rows missing data after :last_id, and the queries that save it
+ENTITIES = {
+    "institution": {
+        "missing": """
+            select affiliation_id as id, wiki_page as wikipedia_url, wikidata_id,
+            wikipedia_json is null as needs_wikipedia, wikidata_json is null as needs_wikidata
+            from mid.institution
+            where affiliation_id > :last_id
+            and merge_into_id is null
+            and ((wiki_page is not null and wikipedia_json is null) or (wikidata_id is not null and wikidata_json is null))
+            order by affiliation_id
+            limit :chunk
+        """,
+        "save_wikipedia": "update mid.institution set wikipedia_json = :data where affiliation_id = :id",
+        "save_wikidata": "update mid.institution set wikidata_json = :data where affiliation_id = :id",
+        "queue_table": "queue.institution_store",
+    },
+    "concept": {
+        "missing": """
+            select field_of_study_id as id, wikipedia_id as wikipedia_url, wikidata_id,
+            wikipedia_json is null as needs_wikipedia, wikidata_json is null as needs_wikidata
+            from mid.concept_metadata
+            where field_of_study_id > :last_id
+            and ((wikipedia_id is not null and wikipedia_json is null) or (wikidata_id is not null and wikidata_json is null))
+            order by field_of_study_id
+            limit :chunk
+        """,
+        "save_wikipedia": "update mid.concept_metadata set wikipedia_json = :data, updated = now() where field_of_study_id = :id",
+        "save_wikidata": "update mid.concept_metadata set wikidata_json = :data, updated = now() where field_of_study_id = :id",
+        "queue_table": "queue.concept_store",
+    },
+}
+
+
+def fetch_wikipedia_data(wikipedia_url):
+    wikipedia_page_name = wikipedia_url.rsplit("/", 1)[-1]
+    url = f"https://en.wikipedia.org/w/api.php?action=query&format=json&formatversion=2&prop=pageprops%7Cpageimages%7Cpageterms&piprop=original%7Cthumbnail&pilicense=any&titles={wikipedia_page_name}&pithumbsize=100&redirects="
+    r = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+    return r.json()
+
+
+def fetch_wikidata_data(wikidata_id):
+    wikidata_id_short = wikidata_id.replace("https://www.wikidata.org/wiki/", "")
+    url = f"https://www.wikidata.org/wiki/Special:EntityData/{wikidata_id_short}.json"
+    r = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+    data = r.json()
+    # claims are too big
+    try:
+        del data["entities"][wikidata_id_short]["claims"]
+    except KeyError:
+        pass
+    return data
+
+
+def fetch_row(row):
+    # runs in a worker thread, http only. returns (id, wikipedia json, wikidata json)
+    wikipedia_json = wikidata_json = None
+    try:
+        if row["needs_wikipedia"] and row["wikipedia_url"]:
+            wikipedia_json = json.dumps(fetch_wikipedia_data(row["wikipedia_url"]), ensure_ascii=False)
+        if row["needs_wikidata"] and row["wikidata_id"]:
+            wikidata_json = json.dumps(fetch_wikidata_data(row["wikidata_id"]), ensure_ascii=False)
+    except (requests.RequestException, ValueError) as e:
+        logger.info(f"error fetching wiki data for {row['id']}: {e}")
+    return row["id"], wikipedia_json, wikidata_json
+
+
+def run(entity, workers, limit=None):
+    queries = ENTITIES[entity]
+    last_id = 0
+    total = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while limit is None or total < limit:
+            start_time = time()
+            rows = db.session.execute(
+                text(queries["missing"]), {"last_id": last_id, "chunk": CHUNK_SIZE}
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            updated_ids = []
+            for id, wikipedia_json, wikidata_json in executor.map(fetch_row, rows):
+                if wikipedia_json:
+                    db.session.execute(text(queries["save_wikipedia"]), {"id": id, "data": wikipedia_json})
+                if wikidata_json:
+                    db.session.execute(text(queries["save_wikidata"]), {"id": id, "data": wikidata_json})
+                if wikipedia_json or wikidata_json:
+                    updated_ids.append(id)
+
+            if updated_ids:
+                db.session.execute(
+                    text(f"""
+                        insert into {queries["queue_table"]} (id) (select unnest(cast(:ids as bigint[])))
+                        on conflict (id)
+                        do update set finished = null
+                    """),
+                    {"ids": updated_ids}
+                )
+            db.session.commit()
+
+            total += len(rows)
+            logger.info(f"saved wiki data for {len(updated_ids)} of {len(rows)} {entity}s in {elapsed(start_time, 2)} seconds")
+
+    logger.info(f"checked {total} {entity}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch missing Wikipedia and Wikidata data outside of store.")
+    parser.add_argument('--entity', type=str, choices=list(ENTITIES.keys()), default="institution")
+    parser.add_argument('--workers', '-w', type=int, default=4, help="how many requests to make at once")
+    parser.add_argument('--limit', '-l', type=int, help="how many entities to check")
+
+    parsed_args = parser.parse_args()
+    run(parsed_args.entity, parsed_args.workers, parsed_args.limit)
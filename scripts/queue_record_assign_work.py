@@ -1,5 +1,6 @@
 import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep, time
 
 from sqlalchemy import orm, text
@@ -13,11 +14,20 @@ from util import elapsed
 
 """
 Run with a recordthresher id: heroku local:run python -- -m scripts.queue_record_assign_work --id=RAqCquzTh3SziwFZGMcbCA
+
+Records are claimed with a lease so several workers can run at once. Workers that claim different
+records with the same doi, pmid or title are serialized on those keys, so they can't both mint a work.
+Needs:
+alter table ins.recordthresher_record add column assign_work_started timestamp without time zone;
 """
 
+DEFAULT_LEASE_MINUTES = 60
+DEFAULT_COLLISION_WORKERS = 4
+
 
 def run(**kwargs):
     if single_id := kwargs.get('id'):
+        lock_match_keys([single_id])
         if record := get_records([single_id]):
             record[0].process_record()
             finish_object_ids([single_id])
@@ -28,10 +38,13 @@ def run(**kwargs):
         objects_updated = 0
         limit = kwargs.get('limit')
         chunk = kwargs.get('chunk')
+        lease_minutes = kwargs.get('lease_minutes') or DEFAULT_LEASE_MINUTES
+        collision_workers = kwargs.get('collision_workers') or DEFAULT_COLLISION_WORKERS
 
         while limit is None or objects_updated < limit:
-            if record_ids := fetch_queue_chunk_ids(chunk):
+            if record_ids := fetch_queue_chunk_ids(chunk, lease_minutes):
                 loop_start = time()
+                lock_match_keys(record_ids)
                 records = get_records(record_ids)
 
                 doi_counts = defaultdict(int)
@@ -57,6 +70,10 @@ def run(**kwargs):
 
                 possibly_colliding_records = [r for r in records if r.id not in unique_record_ids]
 
+                start = time()
+                models.Record.prefetch_work_matches_by_title(unique_records)
+                logger.info(f'prefetched title matches in {elapsed(start, 2)} seconds')
+
                 start = time()
                 for u in unique_records:
                     u.process_record()
@@ -64,11 +81,14 @@ def run(**kwargs):
                 db.session.commit()
                 logger.info(f'mapped {len(unique_records)} unique records in {elapsed(start, 2)} seconds')
 
-                for p in possibly_colliding_records:
-                    start = time()
-                    p.process_record()
-                    db.session.commit()
-                    logger.info(f'did {p.id} in {elapsed(start, 2)} seconds')
+                start = time()
+                components = collision_components(possibly_colliding_records)
+                with ThreadPoolExecutor(max_workers=collision_workers) as executor:
+                    list(executor.map(process_collision_component, components))
+                logger.info(
+                    f'mapped {len(possibly_colliding_records)} possibly colliding records '
+                    f'in {len(components)} groups in {elapsed(start, 2)} seconds'
+                )
 
                 finish_object_ids(record_ids)
                 objects_updated += len(records)
@@ -78,12 +98,95 @@ def run(**kwargs):
                 sleep(5)
 
 
-def fetch_queue_chunk_ids(chunk_size):
+def collision_components(records):
+    """
+    Group record ids into sets of records that share a doi, pmid or normalized title,
+    directly or through other records. Different groups can't match each other's works.
+    """
+    parent = list(range(len(records)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_with_key = {}
+    for i, record in enumerate(records):
+        for key in [('doi', record.doi), ('pmid', record.pmid), ('title', record.normalized_title)]:
+            if not key[1]:
+                continue
+            if key in first_with_key:
+                parent[find(i)] = find(first_with_key[key])
+            else:
+                first_with_key[key] = i
+
+    components = defaultdict(list)
+    for i, record in enumerate(records):
+        components[find(i)].append(record.id)
+    return list(components.values())
+
+
+def process_collision_component(record_ids):
+    # runs in a worker thread, so db.session here is this thread's own session.
+    # records are processed in order in one transaction, flushing after each one
+    # so later records see works minted for earlier ones.
+    start = time()
+    try:
+        lock_match_keys(record_ids)
+        for record_id in record_ids:
+            if records := get_records([record_id]):
+                records[0].process_record()
+                db.session.flush()
+        db.session.commit()
+        logger.info(f'did {record_ids} in {elapsed(start, 2)} seconds')
+    except Exception as e:
+        logger.exception(f'error processing records {record_ids}, rolling back: {e}')
+        db.session.rollback()
+    finally:
+        db.session.remove()
+
+
+def lock_match_keys(record_ids):
+    """
+    Take transaction-level advisory locks on the doi, pmid and normalized title of these records,
+    before their matches are loaded. Another worker holding a record with the same key waits here
+    until that transaction commits, then sees the work it minted. Locks are taken in one sorted
+    order so two chunks can't deadlock on each other.
+    """
+    db.session.execute(
+        text("""
+            with lock_keys as (
+                select distinct hashtext(match_key) as lock_key
+                from ins.recordthresher_record r,
+                unnest(array['doi:' || lower(r.doi), 'pmid:' || r.pmid, 'title:' || r.normalized_title]) match_key
+                where r.id = any(:record_ids)
+                and match_key is not null
+            )
+            select count(pg_advisory_xact_lock(lock_key))
+            from (select lock_key from lock_keys order by lock_key) sorted_keys
+        """),
+        {"record_ids": record_ids}
+    )
+
+
+def fetch_queue_chunk_ids(chunk_size, lease_minutes=DEFAULT_LEASE_MINUTES):
+    # claim records so parallel workers don't process (and mint works for) the same ones.
+    # claims expire after lease_minutes so records from crashed workers get picked up again.
     text_query = """
-        select id from ins.recordthresher_record
-        where work_id is null
-        order by updated asc nulls last
-        limit :chunk;
+        with chunk as (
+            select id from ins.recordthresher_record
+            where work_id is null
+            and (assign_work_started is null or assign_work_started < now() - make_interval(mins => :lease_minutes))
+            order by updated asc nulls last
+            limit :chunk
+            for update skip locked
+        )
+        update ins.recordthresher_record r
+        set assign_work_started = now()
+        from chunk
+        where r.id = chunk.id
+        returning chunk.id;
     """
 
     logger.info(f'getting {chunk_size} record IDs from the queue')
@@ -91,7 +194,10 @@ def fetch_queue_chunk_ids(chunk_size):
 
     ids = [
         row[0] for row in
-        db.engine.execute(text(text_query).bindparams(chunk=chunk_size).execution_options(autocommit=True)).all()
+        db.engine.execute(text(text_query).bindparams(
+            chunk=chunk_size,
+            lease_minutes=lease_minutes
+        ).execution_options(autocommit=True)).all()
     ]
 
     logger.info(f'got {len(ids)} ids from the queue in {elapsed(start_time, 4)}s')
@@ -150,6 +256,14 @@ if __name__ == "__main__":
     parser.add_argument(
         '--chunk', "-ch", nargs="?", default=100, type=int, help="how many objects to take off the queue at once"
     )
+    parser.add_argument(
+        '--lease_minutes', nargs="?", default=DEFAULT_LEASE_MINUTES, type=int,
+        help="how long a claimed record is held before another worker can take it"
+    )
+    parser.add_argument(
+        '--collision_workers', nargs="?", default=DEFAULT_COLLISION_WORKERS, type=int,
+        help="how many groups of possibly colliding records to process at once"
+    )
 
     parsed_args = parser.parse_args()
     run(**vars(parsed_args))
\ No newline at end of file
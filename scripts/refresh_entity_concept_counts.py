@@ -0,0 +1,141 @@
+import argparse
+from time import time
+
+from sqlalchemy import text
+
+from app import db
+from app import logger
+from models.concept import ENTITY_PAPERS
+from util import elapsed
+
+
+"""
+Keeps mid.entity_concept_counts up to date for Source.concepts and Institution.concepts,
+so storing a big journal or institution doesn't aggregate concepts over all of its works.
+
+Recompute entities with works whose concepts changed since the last run:
+  heroku local:run python -- -m scripts.refresh_entity_concept_counts
+Recompute everything, needed once to fill the table:
+  heroku local:run python -- -m scripts.refresh_entity_concept_counts --full
+Recompute one entity:
+  heroku local:run python -- -m scripts.refresh_entity_concept_counts --entity_type=source --id=123
+
+Needs the tables and indexes in sql/migrations/entity_concept_counts.sql.
+
+Each entity type has its own row in log.entity_concept_counts_refresh. Until the first --full run
+for a type finishes and logs its row, that type's concepts keep being counted from its works, and
+incremental runs skip it.
+Works found through mid.work.updated_date cover changed journal_ids and works that lost their concepts.
+A work moved away from a source only refreshes its new source. scripts/merge.py refreshes both
+sides of a source merge.
+"""
+
+# entity_type -> query for entities with a paper in the changed_works cte, or an affiliation changed since :since
+CHANGED_ENTITIES = {
+    "source": """
+        select distinct work.journal_id
+        from changed_works join mid.work work on work.paper_id = changed_works.paper_id
+        where work.journal_id is not null
+    """,
+    "institution": """
+        select affil.affiliation_id
+        from changed_works join mid.institution_papers_mv affil on affil.paper_id = changed_works.paper_id
+        union
+        select affiliation_id
+        from mid.affiliation
+        where updated_date > :since
+        and affiliation_id is not null
+    """,
+}
+
+ALL_ENTITIES = {
+    "source": "select distinct journal_id from mid.work where journal_id is not null",
+    "institution": "select distinct affiliation_id from mid.institution_papers_mv",
+}
+
+REFRESH_CHUNK_SIZE = 100
+
+
+def refresh_entities(entity_type, entity_ids):
+    start_time = time()
+    db.session.execute(
+        text("""
+            delete from mid.entity_concept_counts
+            where entity_type = :entity_type and entity_id = any(:entity_ids)
+        """),
+        {"entity_type": entity_type, "entity_ids": entity_ids}
+    )
+    db.session.execute(
+        text(f"""
+            insert into mid.entity_concept_counts (entity_type, entity_id, ancestor_id, paper_count)
+            select :entity_type, entity_papers.entity_id, ancestors.ancestor_id, count(distinct wc.paper_id)
+            from ({ENTITY_PAPERS[entity_type]}) entity_papers
+            join mid.work_concept wc on wc.paper_id = entity_papers.paper_id
+            join mid.concept_self_and_ancestors_mv ancestors on ancestors.id = wc.field_of_study
+            group by entity_papers.entity_id, ancestors.ancestor_id
+        """),
+        {"entity_type": entity_type, "entity_ids": entity_ids}
+    )
+    db.session.commit()
+    logger.info(f'refreshed {len(entity_ids)} {entity_type}s in {elapsed(start_time, 2)} seconds')
+
+
+def changed_entity_ids(entity_type, since):
+    q = f"""
+        with changed_works as (
+            select paper_id from mid.work_concept where updated_date > :since
+            union
+            select paper_id from mid.work where updated_date > :since
+        )
+        {CHANGED_ENTITIES[entity_type]}
+    """
+    return [row[0] for row in db.session.execute(text(q), {"since": since}).fetchall()]
+
+
+def run(entity_type=None, entity_id=None, full=False):
+    if entity_type and entity_id:
+        refresh_entities(entity_type, [entity_id])
+        return
+
+    for each_type in ([entity_type] if entity_type else ENTITY_PAPERS.keys()):
+        refresh_entity_type(each_type, full)
+
+
+def refresh_entity_type(entity_type, full=False):
+    refreshed_through = db.session.execute(text("select now()::timestamp")).scalar()
+    since = db.session.execute(
+        text("select max(refreshed_through) from log.entity_concept_counts_refresh where entity_type = :entity_type"),
+        {"entity_type": entity_type}
+    ).scalar()
+
+    if since is None and not full:
+        logger.info(f'{entity_type} concept counts have never been refreshed, run with --full first')
+        return
+
+    if full:
+        entity_ids = [row[0] for row in db.session.execute(text(ALL_ENTITIES[entity_type])).fetchall()]
+    else:
+        entity_ids = changed_entity_ids(entity_type, since)
+
+    logger.info(f'refreshing concept counts for {len(entity_ids)} {entity_type}s')
+    for i in range(0, len(entity_ids), REFRESH_CHUNK_SIZE):
+        refresh_entities(entity_type, entity_ids[i:i + REFRESH_CHUNK_SIZE])
+
+    db.session.execute(
+        text("""
+            insert into log.entity_concept_counts_refresh (entity_type, refreshed_through)
+            values (:entity_type, :refreshed_through)
+        """),
+        {"entity_type": entity_type, "refreshed_through": refreshed_through}
+    )
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh precomputed concept counts for sources and institutions.")
+    parser.add_argument('--entity_type', type=str, choices=list(ENTITY_PAPERS.keys()), help="only refresh this entity type")
+    parser.add_argument('--id', type=int, help="id of one entity to refresh, needs --entity_type")
+    parser.add_argument('--full', action='store_true', help="refresh every entity, not just ones with changed works")
+
+    parsed_args = parser.parse_args()
+    run(parsed_args.entity_type, parsed_args.id, parsed_args.full)
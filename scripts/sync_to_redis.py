@@ -1,37 +1,89 @@
+import argparse
 import time
 import logging
 from redis import Redis
+from redis.exceptions import ResponseError
 import csv
-from app import REDIS_QUEUE_URL
+from sqlalchemy import text
+from app import REDIS_QUEUE_URL, db
 from models import REDIS_WORK_QUEUE
+from util import elapsed
 
 logger = logging.getLogger(__name__)
 
-def add_missing_ids_to_redis(batch_size=100):
+DEFAULT_CSV_FILENAME = 'scripts/work_ids_2024_10_17.csv'
+
+
+def ids_from_csv(filename):
+    with open(filename, 'r') as f:
+        for row in csv.reader(f):
+            yield row[0]
+
+
+def ids_from_sql(sql_query):
+    # server-side cursor, so the ids aren't all loaded into memory
+    with db.engine.connect().execution_options(stream_results=True) as conn:
+        for row in conn.execute(text(sql_query)):
+            yield str(row[0])
+
+
+def chunks(ids, chunk_size):
+    chunk = []
+    for id_ in ids:
+        chunk.append(id_)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def queue_scores(_redis, paper_ids):
+    try:
+        return _redis.zmscore(REDIS_WORK_QUEUE, paper_ids)
+    except ResponseError:
+        # ZMSCORE needs redis 6.2
+        pipe = _redis.pipeline(transaction=False)
+        for paper_id in paper_ids:
+            pipe.zscore(REDIS_WORK_QUEUE, paper_id)
+        return pipe.execute()
+
+
+def add_missing_ids_to_redis(batch_size=1000, filename=DEFAULT_CSV_FILENAME, sql_query=None):
     _redis = Redis.from_url(REDIS_QUEUE_URL)
 
-    with open('scripts/work_ids_2024_10_17.csv', 'r') as f:
-        reader = csv.reader(f)
-        paper_ids = [row[0] for row in reader]
+    paper_ids = ids_from_sql(sql_query) if sql_query else ids_from_csv(filename)
 
     redis_queue_time = time.time()
+    start = time.time()
+    total = 0
+    total_added = 0
 
-    for i in range(0, len(paper_ids), batch_size):
-        batch = paper_ids[i:i + batch_size]
-        missing_ids = {}
-
-        for paper_id in batch:
-            if not _redis.zscore(REDIS_WORK_QUEUE, paper_id):
-                print(f"Adding missing ID {paper_id} to Redis queue.")
-                missing_ids[paper_id] = redis_queue_time
+    for batch_number, batch in enumerate(chunks(paper_ids, batch_size), 1):
+        scores = queue_scores(_redis, batch)
+        missing_ids = {
+            paper_id: redis_queue_time for paper_id, score in zip(batch, scores) if score is None
+        }
 
         if missing_ids:
             _redis.zadd(REDIS_WORK_QUEUE, missing_ids)
             logger.info(f"Added {len(missing_ids)} missing paper IDs to Redis queue.")
 
-        logger.info(f"Processed batch {i // batch_size + 1} of {len(paper_ids) // batch_size + 1}")
+        total += len(batch)
+        total_added += len(missing_ids)
+        logger.info(
+            f"Processed batch {batch_number}, {total} ids checked, {total_added} added, "
+            f"{round(total / max(elapsed(start), 0.001))} ids/sec"
+        )
+
+    logger.info(f"Finished adding missing IDs to Redis queue. Added {total_added} of {total}.")
 
-    logger.info("Finished adding missing IDs to Redis queue.")
 
 if __name__ == "__main__":
-    add_missing_ids_to_redis()
+    parser = argparse.ArgumentParser(description="Add work ids that aren't in the redis work queue.")
+    parser.add_argument('--filename', type=str, default=DEFAULT_CSV_FILENAME, help="csv file of work ids")
+    parser.add_argument('--sql', type=str, help="query returning work ids, used instead of the csv file")
+    parser.add_argument('--chunk', type=int, default=1000, help="how many ids to check per round trip")
+    parsed_args = parser.parse_args()
+
+    add_missing_ids_to_redis(batch_size=parsed_args.chunk, filename=parsed_args.filename, sql_query=parsed_args.sql)
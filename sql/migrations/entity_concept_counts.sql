@@ -0,0 +1,26 @@
+/*
+Tables for scripts/refresh_entity_concept_counts.py. Source.concepts and Institution.concepts read
+mid.entity_concept_counts once an entity type has a row in log.entity_concept_counts_refresh.
+After running this, fill the table with:
+  heroku run python -- -m scripts.refresh_entity_concept_counts --full
+*/
+
+create table if not exists mid.entity_concept_counts (
+    entity_type text not null,
+    entity_id bigint not null,
+    ancestor_id bigint not null,
+    paper_count integer not null,
+    primary key (entity_type, entity_id, ancestor_id)
+);
+
+create table if not exists log.entity_concept_counts_refresh (
+    entity_type text not null,
+    refreshed_through timestamp without time zone not null
+);
+create index if not exists entity_concept_counts_refresh_entity_type_idx
+    on log.entity_concept_counts_refresh (entity_type, refreshed_through);
+
+-- incremental refreshes find changed works and affiliations through these
+create index if not exists work_concept_updated_date_idx on mid.work_concept (updated_date);
+create index if not exists work_updated_date_idx on mid.work (updated_date);
+create index if not exists affiliation_updated_date_idx on mid.affiliation (updated_date);
@@ -0,0 +1,95 @@
+"""
+Tests for pure functions run anywhere. Tests that use the models or db fixtures need a postgres server
+they can make a scratch database on, and are skipped without one:
+
+  TEST_POSTGRES_URL=postgresql://postgres@localhost:5432/postgres python -m pytest tests
+
+The scratch database, openalex_guts_test, is dropped and recreated for each run. Every table the models
+map is created in it, empty and without foreign keys, as the models are imported, so the import-time
+loads in models/ find their tables.
+"""
+import logging
+import os
+import sys
+import types
+from urllib.parse import urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+TEST_DATABASE = "openalex_guts_test"
+
+_created_tables = []
+
+
+def create_scratch_database():
+    import psycopg2
+
+    admin_connection = psycopg2.connect(TEST_POSTGRES_URL)
+    admin_connection.autocommit = True
+    with admin_connection.cursor() as cur:
+        cur.execute(f"drop database if exists {TEST_DATABASE}")
+        cur.execute(f"create database {TEST_DATABASE}")
+    admin_connection.close()
+    return urlparse(TEST_POSTGRES_URL)._replace(path=f"/{TEST_DATABASE}").geturl()
+
+
+def create_tables_on_import(database_url):
+    from sqlalchemy import Table, create_engine, event
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+
+    engine = create_engine(database_url)
+
+    def create_table(table, metadata):
+        ddl = str(CreateTable(table, include_foreign_key_constraints=[]).compile(dialect=postgresql.dialect()))
+        with engine.begin() as connection:
+            if table.schema:
+                connection.exec_driver_sql(f'create schema if not exists "{table.schema}"')
+            connection.exec_driver_sql(ddl.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+        _created_tables.append(table.fullname)
+
+    event.listen(Table, "after_parent_attach", create_table)
+    with engine.begin() as connection:
+        for schema in ("mid", "ins", "queue", "log", "legacy"):
+            connection.exec_driver_sql(f"create schema if not exists {schema}")
+
+
+if TEST_POSTGRES_URL:
+    scratch_database_url = create_scratch_database()
+    os.environ["POSTGRES_URL"] = scratch_database_url
+    os.environ["UNPAYWALL_DATABASE_URL"] = scratch_database_url
+    # clients are created at import but don't connect until used, tests swap in fakes
+    os.environ.setdefault("REDIS_DO_FAST_QUEUE_URL", "redis://localhost:6379")
+    os.environ.setdefault("REDISCLOUD_URL", "redis://localhost:6379")
+    os.environ.setdefault("ELASTIC_URL", "http://localhost:9200")
+    create_tables_on_import(scratch_database_url)
+else:
+    # app connects to postgres when it's imported. without a database, util and bulk_actions
+    # get the two names they import from it and nothing else.
+    app = types.ModuleType("app")
+    app.logger = logging.getLogger("openalex-guts-tests")
+    app.unpaywall_db_engine = None
+    sys.modules["app"] = app
+
+
+@pytest.fixture(scope="session")
+def models():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("needs TEST_POSTGRES_URL")
+    import models
+    return models
+
+
+@pytest.fixture
+def db(models):
+    from app import db
+
+    yield db
+
+    db.session.rollback()
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f"truncate {', '.join(sorted(set(_created_tables)))}")
@@ -0,0 +1,51 @@
+import datetime
+
+from bulk_actions import create_bulk_actions
+
+
+class StubCountry:
+    id = "https://openalex.org/countries/US"
+
+    def __init__(self):
+        self.json_entity_hash = None
+        self.display_name = "United States"
+
+    def continent_to_dict(self):
+        return {
+            "id": "https://openalex.org/continents/Q49",
+            "display_name": "North America",
+            "updated_date": datetime.datetime.utcnow().isoformat(),
+        }
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "display_name": self.display_name,
+            "continent": self.continent_to_dict(),
+            "updated_date": datetime.datetime.utcnow().isoformat(),
+        }
+
+
+def test_unchanged_entity_is_not_indexed_again():
+    country = StubCountry()
+    bulk_actions, country.json_entity_hash = create_bulk_actions(country, "countries")
+    assert len(bulk_actions) == 1
+
+    bulk_actions, new_hash = create_bulk_actions(country, "countries")
+    assert bulk_actions == []
+    assert new_hash == country.json_entity_hash
+
+
+def test_changed_entity_is_indexed_with_volatile_fields():
+    country = StubCountry()
+    _, country.json_entity_hash = create_bulk_actions(country, "countries")
+
+    country.display_name = "United States of America"
+    bulk_actions, new_hash = create_bulk_actions(country, "countries")
+    assert len(bulk_actions) == 1
+    assert new_hash != country.json_entity_hash
+
+    source = bulk_actions[0]["_source"]
+    assert source["updated"] == source["updated_date"]
+    assert "@timestamp" in source
+    assert "updated_date" in source["continent"]
@@ -0,0 +1,149 @@
+import os
+import random
+
+import pytest
+
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql/migrations/entity_concept_counts.sql")
+
+
+@pytest.fixture
+def concept_db(db):
+    from models.concept import _entity_concept_counts_ready
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(open(MIGRATION).read())
+        connection.exec_driver_sql("create table if not exists mid.concept_self_and_ancestors_mv (id bigint, ancestor_id bigint)")
+        connection.exec_driver_sql("create table if not exists mid.institution_papers_mv (affiliation_id bigint, paper_id bigint)")
+    _entity_concept_counts_ready.clear()
+
+    yield db
+
+    _entity_concept_counts_ready.clear()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("""
+            truncate mid.entity_concept_counts, log.entity_concept_counts_refresh,
+            mid.concept_self_and_ancestors_mv, mid.institution_papers_mv
+        """)
+
+
+def add_concepts(db, concept_ids):
+    db.session.execute(
+        "insert into mid.concept_api_mv (field_of_study_id, display_name, wikidata_id, level) "
+        "select id, 'concept ' || id, 'Q' || id, id % 3 from unnest(cast(:ids as bigint[])) id",
+        {"ids": concept_ids}
+    )
+    # every concept is its own ancestor, and concept n also has ancestor n % 5
+    db.session.execute(
+        "insert into mid.concept_self_and_ancestors_mv (id, ancestor_id) "
+        "select id, id from unnest(cast(:ids as bigint[])) id "
+        "union select id, id % 5 from unnest(cast(:ids as bigint[])) id where id % 5 <> id and id % 5 > 0",
+        {"ids": concept_ids}
+    )
+
+
+def entity_concepts_by_id(entity_type, entity_id, paper_count):
+    from models.concept import entity_concepts
+    return sorted(entity_concepts(entity_type, entity_id, paper_count), key=lambda c: c["id"])
+
+
+def test_precomputed_counts_match_live_query(concept_db):
+    from scripts.refresh_entity_concept_counts import run
+
+    db = concept_db
+    add_concepts(db, [1, 2, 3, 7])
+    db.session.execute(
+        "insert into mid.work (paper_id, journal_id) select id, 100 from generate_series(1, 10) id"
+    )
+    db.session.execute("""
+        insert into mid.work_concept (paper_id, field_of_study, score)
+        select id, 7, 0.5 from generate_series(1, 6) id
+        union all select id, 3, 0.5 from generate_series(5, 10) id
+        union all select 1, 1, 0.5
+    """)
+    db.session.execute("insert into mid.institution_papers_mv select 200, id from generate_series(1, 4) id")
+    db.session.commit()
+
+    live_source = entity_concepts_by_id("source", 100, 10)
+    live_institution = entity_concepts_by_id("institution", 200, 4)
+    assert [c["id"] for c in live_source] == [
+        "https://openalex.org/C2", "https://openalex.org/C3", "https://openalex.org/C7"
+    ]
+
+    run(full=True)
+
+    assert entity_concepts_by_id("source", 100, 10) == live_source
+    assert entity_concepts_by_id("institution", 200, 4) == live_institution
+
+
+def test_each_entity_type_waits_for_its_own_full_refresh(concept_db):
+    from scripts.refresh_entity_concept_counts import run
+
+    db = concept_db
+    add_concepts(db, [3])
+    db.session.execute("insert into mid.work (paper_id, journal_id) values (1, 100)")
+    db.session.execute("insert into mid.work_concept (paper_id, field_of_study, score) values (1, 3, 0.5)")
+    db.session.execute("insert into mid.institution_papers_mv values (200, 1)")
+    db.session.commit()
+
+    run(entity_type="source", full=True)
+
+    institution_rows = db.session.execute(
+        "select count(*) from mid.entity_concept_counts where entity_type = 'institution'"
+    ).scalar()
+    assert institution_rows == 0
+    # institutions haven't been refreshed, so they still count from their works
+    assert [c["id"] for c in entity_concepts_by_id("institution", 200, 1)] == ["https://openalex.org/C3"]
+
+    # and an incremental run doesn't treat the source refresh as the institution watermark
+    run()
+    assert db.session.execute(
+        "select array_agg(distinct entity_type) from log.entity_concept_counts_refresh"
+    ).scalar() == ["source"]
+
+
+def test_incremental_refresh_sees_changed_journal(concept_db):
+    from scripts.refresh_entity_concept_counts import run
+
+    db = concept_db
+    add_concepts(db, [3])
+    db.session.execute("insert into mid.work (paper_id, journal_id) values (1, 100), (2, 100)")
+    db.session.execute("insert into mid.work_concept (paper_id, field_of_study, score) values (1, 3, 0.5), (2, 3, 0.5)")
+    db.session.commit()
+    run(entity_type="source", full=True)
+
+    db.session.execute("update mid.work set journal_id = 101, updated_date = now() + interval '1 second' where paper_id = 2")
+    db.session.commit()
+    run(entity_type="source")
+
+    assert [c["id"] for c in entity_concepts_by_id("source", 101, 1)] == ["https://openalex.org/C3"]
+
+
+def test_precomputed_counts_match_live_query_on_200k_works(concept_db):
+    from scripts.refresh_entity_concept_counts import run
+
+    db = concept_db
+    add_concepts(db, list(range(1, 51)))
+    db.session.execute("""
+        insert into mid.work (paper_id, journal_id)
+        select id, 1000 + (hashint4(id) & 2047) from generate_series(1, 200000) id
+    """)
+    # skewed so most sources have some concepts over 20%
+    db.session.execute("""
+        insert into mid.work_concept (paper_id, field_of_study, score)
+        select distinct id, 1 + least(49, floor(-ln(1 - random()) * 6))::bigint, 0.5
+        from generate_series(1, 200000) id, generate_series(1, 3)
+    """)
+    db.session.commit()
+
+    paper_counts = dict(db.session.execute(
+        "select journal_id, count(*) from mid.work group by journal_id"
+    ).fetchall())
+    sample = random.Random(0).sample(sorted(paper_counts), 100)
+
+    live = {journal_id: entity_concepts_by_id("source", journal_id, paper_counts[journal_id]) for journal_id in sample}
+    assert any(live.values())
+
+    run(entity_type="source", full=True)
+
+    for journal_id in sample:
+        assert entity_concepts_by_id("source", journal_id, paper_counts[journal_id]) == live[journal_id]
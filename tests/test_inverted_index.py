@@ -0,0 +1,46 @@
+import json
+import random
+
+from util import f_generate_inverted_index, generate_inverted_index
+
+WORD_PARTS = [
+    "cell", "Cell", "cells", "the", "of", "β-catenin", "naïve", "数据", "\"quoted\"", "back\\slash",
+    "<jats:p>", "</jats:p>", "<jats:italic>", "<p>", "</p>", "\b", "\n", "\t", "  ", "1", "10", "{}", "é",
+]
+
+
+def random_abstract(rng):
+    return " ".join(
+        "".join(rng.choice(WORD_PARTS) for _ in range(rng.randint(1, 3)))
+        for _ in range(rng.randint(0, 60))
+    )
+
+
+def words_of(inverted_index_json):
+    inverted_index = json.loads(inverted_index_json)
+    words = [None] * inverted_index["IndexLength"]
+    for word, positions in inverted_index["InvertedIndex"].items():
+        for position in positions:
+            words[position] = word
+    return words
+
+
+def test_matches_f_generate_inverted_index():
+    rng = random.Random(0)
+    for _ in range(5000):
+        abstract = random_abstract(rng)
+        assert generate_inverted_index(abstract) == f_generate_inverted_index(abstract)
+
+
+def test_max_length_keeps_longest_prefix_that_fits():
+    rng = random.Random(1)
+    for _ in range(300):
+        abstract = random_abstract(rng)
+        full = f_generate_inverted_index(abstract)
+        words = words_of(full)
+        prefixes = [f_generate_inverted_index(" ".join(words[:i])) for i in range(len(words) + 1)]
+        max_length = rng.randint(len(prefixes[0]), len(full) + 10)
+
+        fitting = [prefix for prefix in prefixes if len(prefix) < max_length]
+        expected = fitting[-1] if fitting else prefixes[0]
+        assert generate_inverted_index(abstract, max_length=max_length) == expected
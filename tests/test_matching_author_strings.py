@@ -0,0 +1,33 @@
+import pytest
+
+from util import cached_matching_author_strings, matching_author_strings
+
+GOLDEN = [
+    ("Jane Q. Smith", ["smith;j", "jane;smith", "smith;jane"]),
+    ("Smith, Jane", ["smith;j", "jane;smith", "smith;jane"]),
+    ("Dr. José García-López", ["garcialopez;j", "jose;garcialopez", "garcialopez;jose"]),
+    ("Zoë Ångström", ["angstrom;z", "zoe;angstrom", "angstrom;zoe"]),
+    ("van der Berg, Anna", ["vanderberg;a", "anna;vanderberg", "vanderberg;anna"]),
+    ("O'Brien, Seán", ["obrien;s", "sean;obrien", "obrien;sean"]),
+    ("Prof. Dr. Hans Müller Jr.", ["muller;h", "hans;muller", "muller;hans"]),
+    ("", [";", ";", ";"]),
+]
+
+
+@pytest.mark.parametrize("author, expected", GOLDEN)
+def test_golden(author, expected):
+    cached_matching_author_strings.cache_clear()
+    assert matching_author_strings(author) == expected
+    # second call is a cache hit and must give the same answer
+    assert matching_author_strings(author) == expected
+
+
+@pytest.mark.parametrize("author, expected", GOLDEN)
+def test_cached_matches_uncached(author, expected):
+    assert matching_author_strings(author) == list(cached_matching_author_strings.__wrapped__(author))
+
+
+def test_callers_get_their_own_list():
+    strings = matching_author_strings("Jane Q. Smith")
+    strings.append("changed")
+    assert matching_author_strings("Jane Q. Smith") == ["smith;j", "jane;smith", "smith;jane"]
@@ -1,4 +1,5 @@
 from datetime import datetime
+from time import sleep
 from sqlalchemy import text
 from scripts.add_things_queue import enqueue_jobs
 
@@ -16,30 +17,37 @@ def make_recordthresher_id():
     return shortuuid.uuid()[:22]
 
 
-def update_or_insert_record(session, work_id):
+def upsert_records(session, work_ids):
+    # update existing mag_location records for the whole batch at once
     update_query = """
         UPDATE ins.recordthresher_record
         SET authors = mag_authors.authors
         FROM ins.mag_authors AS mag_authors
         WHERE ins.recordthresher_record.work_id = mag_authors.work_id
           AND ins.recordthresher_record.record_type = 'mag_location'
-          AND ins.recordthresher_record.work_id = :work_id;
+          AND ins.recordthresher_record.work_id = ANY(:work_ids)
+        RETURNING ins.recordthresher_record.work_id;
     """
 
-    result = session.execute(text(update_query), {'work_id': work_id})
+    updated_work_ids = {
+        row[0] for row in
+        session.execute(text(update_query), {'work_ids': work_ids}).fetchall()
+    }
 
-    if result.rowcount == 0:
-        record_id = make_recordthresher_id()
+    # then insert one for each work that didn't have one
+    if missing_work_ids := [w for w in work_ids if w not in updated_work_ids]:
         insert_query = """
             INSERT INTO ins.recordthresher_record (id, work_id, record_type, authors)
-            SELECT :id, :work_id, 'mag_location', mag_authors.authors
-            FROM ins.mag_authors
-            WHERE work_id = :work_id;
+            SELECT new_records.id, new_records.work_id, 'mag_location', mag_authors.authors
+            FROM unnest(CAST(:ids AS text[]), CAST(:work_ids AS bigint[])) AS new_records (id, work_id)
+            JOIN ins.mag_authors ON mag_authors.work_id = new_records.work_id;
         """
-        session.execute(text(insert_query),
-                        {'id': record_id, 'work_id': work_id})
+        session.execute(text(insert_query), {
+            'ids': [make_recordthresher_id() for _ in missing_work_ids],
+            'work_ids': missing_work_ids
+        })
 
-    session.commit()
+    return len(updated_work_ids), len(missing_work_ids)
 
 
 def dequeue_work_ids(num):
@@ -55,13 +63,17 @@ if __name__ == '__main__':
         work_ids = dequeue_work_ids(BATCH_SIZE)
         print(f'Popped {len(work_ids)} work ids from {UPSERT_QUEUE}')
 
-        for work_id in work_ids:
-            update_or_insert_record(db.session, work_id)
-            count += 1
+        if not work_ids:
+            print(f'No work ids in {UPSERT_QUEUE}, sleeping')
+            sleep(5)
+            continue
+
+        upsert_records(db.session, work_ids)
+        count += len(work_ids)
         last_work_id = work_ids[-1]
-        mark_updated_query = '''UPDATE ins.mag_authors SET finished = true WHERE work_id IN :work_ids'''
-        db.session.execute(text(mark_updated_query),
-                           {'work_ids': tuple(work_ids)})
+        mark_updated_query = '''UPDATE ins.mag_authors SET finished = true WHERE work_id = ANY(:work_ids)'''
+        db.session.execute(text(mark_updated_query), {'work_ids': work_ids})
+        db.session.commit()
         enqueue_jobs(work_ids, methods=None, fast_queue_priority=-1)
         now = datetime.now()
         elapsed_hrs = (now - start).total_seconds() / 3600
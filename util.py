@@ -15,6 +15,7 @@ import hashlib
 import heroku3
 import json
 import copy
+import functools
 from nameparser import HumanName
 import string
 
@@ -30,17 +31,31 @@ from langdetect import detect_langs, DetectorFactory, LangDetectException
 from app import unpaywall_db_engine
 
 UNPAYWALL_DB_CONN = None
+MATCHING_AUTHOR_STRINGS_CACHE_SIZE = 100000
+
+
+# fields that change every time an entity is serialized, even if nothing else did
+VOLATILE_ENTITY_FIELDS = ("updated_date", "updated", "@timestamp")
+# nested full to_dict()s (like a country's continent) stamp updated_date too
+NESTED_VOLATILE_ENTITY_FIELDS = ("updated_date",)
+
+
+def without_volatile_fields(entity_repr, volatile_fields=VOLATILE_ENTITY_FIELDS):
+    if isinstance(entity_repr, dict):
+        return {
+            k: without_volatile_fields(v, NESTED_VOLATILE_ENTITY_FIELDS)
+            for k, v in entity_repr.items() if k not in volatile_fields
+        }
+    if isinstance(entity_repr, list):
+        return [without_volatile_fields(v, NESTED_VOLATILE_ENTITY_FIELDS) for v in entity_repr]
+    return entity_repr
 
 
 def entity_md5(entity_repr):
     if isinstance(entity_repr, int):
         return text_md5(str(entity_repr))
     if isinstance(entity_repr, dict):
-        entity_copy = entity_repr.copy()
-        entity_copy.pop("updated_date", None)
-        entity_copy.pop("updated", None)
-        entity_copy.pop("@timestamp", None)
-        entity_str = json.dumps(entity_copy, sort_keys=True)
+        entity_str = json.dumps(without_volatile_fields(entity_repr), sort_keys=True)
         return text_md5(entity_str)
 
 
@@ -732,7 +747,62 @@ def f_generate_inverted_index(abstract_string):
     return json.dumps(result, ensure_ascii=False)
 
 
+INVERTED_INDEX_SEPARATORS_RE = re.compile(r"</?jats:[^<]+>|</?p>|\x08")
+INVERTED_INDEX_PREFIX = '{"IndexLength": '
+INVERTED_INDEX_MIDDLE = ', "InvertedIndex": {'
+INVERTED_INDEX_SUFFIX = '}}'
+
+
+def generate_inverted_index(abstract_string, max_length=None):
+    """
+    Single-pass version of f_generate_inverted_index with the same output.
+    If max_length is set, words are added only while the serialized index stays
+    shorter than max_length characters, so the result never needs a second pass.
+    """
+    words = INVERTED_INDEX_SEPARATORS_RE.sub(" ", abstract_string).split()
+
+    inverted_index = {}
+    # length of the serialized InvertedIndex body, without IndexLength and braces
+    body_length = 0
+    index_length = 0
+    fixed_length = len(INVERTED_INDEX_PREFIX) + len(INVERTED_INDEX_MIDDLE) + len(INVERTED_INDEX_SUFFIX)
+    for position, word in enumerate(words):
+        position_str = str(position)
+        positions = inverted_index.get(word)
+        if positions is None:
+            # "word": [position] plus ", " before every entry except the first
+            added_length = len(json.dumps(word, ensure_ascii=False)) + 4 + len(position_str)
+            if inverted_index:
+                added_length += 2
+        else:
+            added_length = 2 + len(position_str)
+
+        if max_length is not None:
+            new_length = fixed_length + len(str(position + 1)) + body_length + added_length
+            if new_length >= max_length:
+                break
+
+        if positions is None:
+            inverted_index[word] = [position]
+        else:
+            positions.append(position)
+        body_length += added_length
+        index_length = position + 1
+
+    result = {
+        "IndexLength": index_length,
+        "InvertedIndex": inverted_index,
+    }
+    return json.dumps(result, ensure_ascii=False)
+
+
 def matching_author_strings(author):
+    return list(cached_matching_author_strings(author))
+
+
+@functools.lru_cache(maxsize=MATCHING_AUTHOR_STRINGS_CACHE_SIZE)
+def cached_matching_author_strings(author):
+    # HumanName parsing is slow and the same names come up for every title match candidate
     author = remove_latin_characters(author)
     author = remove_author_prefixes(author)
     author_name = HumanName(author)
@@ -740,11 +810,11 @@ def matching_author_strings(author):
     first_name = clean_author_name(author_name.first)
     last_name = clean_author_name(author_name.last)
     first_initial = first_name[0] if first_name else ""
-    return [
+    return (
         f"{last_name};{first_initial}",
         f"{first_name};{last_name}",
         f"{last_name};{first_name}",
-    ]
+    )
 
 
 def remove_latin_characters(author):